@@ -1,19 +1,35 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-from fast_captcha import img_captcha
+from time import perf_counter
+
 from fastapi import APIRouter, Depends, Request
 from fastapi_limiter.depends import RateLimiter
 from starlette.concurrency import run_in_threadpool
 
 from backend.app.admin.schema.captcha import GetCaptchaDetail
+from backend.common.metrics import CAPTCHA_GENERATION_DURATION, CAPTCHA_GENERATIONS_IN_PROGRESS
 from backend.common.response.response_schema import ResponseSchemaModel, response_base
 from backend.core.conf import settings
 from backend.database.db import uuid4_str
-from backend.database.redis import redis_client
+from backend.database.redis import get_redis_client, redis_key
 
 router = APIRouter()
 
 
+def render_captcha(img_type: str) -> tuple[str, str]:
+    """
+    Render a captcha image, in a worker thread
+
+    fast_captcha pulls in PIL, it is imported by the first captcha request rather than at worker startup
+
+    :param img_type:
+    :return: Image and code
+    """
+    from fast_captcha import img_captcha
+
+    return img_captcha(img_byte=img_type)
+
+
 @router.get(
     '',
     summary='Get login captcha',
@@ -25,11 +41,18 @@ async def get_captcha(request: Request) -> ResponseSchemaModel[GetCaptchaDetail]
     captcha generation is an IO-intensive task, so a thread pool is used to minimize performance loss
     """
     img_type: str = 'base64'
-    img, code = await run_in_threadpool(img_captcha, img_byte=img_type)
+    in_progress = CAPTCHA_GENERATIONS_IN_PROGRESS.labels()
+    in_progress.inc()
+    start_time = perf_counter()
+    try:
+        img, code = await run_in_threadpool(render_captcha, img_type)
+    finally:
+        CAPTCHA_GENERATION_DURATION.labels().observe(perf_counter() - start_time)
+        in_progress.dec()
     uuid = uuid4_str()
     request.app.state.captcha_uuid = uuid
-    await redis_client.set(
-        f'{settings.CAPTCHA_LOGIN_REDIS_PREFIX}:{uuid}',
+    await get_redis_client().set(
+        redis_key(settings.CAPTCHA_LOGIN_REDIS_PREFIX, uuid),
         code,
         ex=settings.CAPTCHA_LOGIN_EXPIRE_SECONDS,
     )
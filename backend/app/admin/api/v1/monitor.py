@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from typing import Annotated
+
+from fastapi import APIRouter, Query
+
+from backend.app.admin.schema.monitor import GetProfileDetail
+from backend.app.admin.service.monitor_service import MonitorService
+from backend.common.profiler import ProfileFormat
+from backend.common.response.response_schema import ResponseModel, ResponseSchemaModel, response_base
+from backend.common.security.jwt import CurrentUser, DependsJwtAuth
+from backend.core.conf import settings
+
+router = APIRouter()
+
+
+@router.get(
+    '/health',
+    summary='Health check',
+    description='Answered by the worker without touching the database or redis, so it shows whether the worker serves',
+)
+async def health() -> ResponseModel:
+    return response_base.success()
+
+
+@router.post(
+    '/profile',
+    summary='Profile the worker',
+    description='Sample the event loop stacks of the worker serving this request, for flame graphs of live traffic',
+    dependencies=[DependsJwtAuth],
+)
+async def profile_worker(
+    current_user: CurrentUser,
+    seconds: Annotated[float, Query(gt=0, le=settings.PROFILER_MAX_SECONDS)] = 10,
+    profile_format: Annotated[ProfileFormat, Query(alias='format')] = settings.PROFILER_FORMAT,
+) -> ResponseSchemaModel[GetProfileDetail]:
+    data = await MonitorService.profile(current_user=current_user, seconds=seconds, profile_format=profile_format)
+    return response_base.success(data=data)
@@ -2,20 +2,21 @@
 # -*- coding: utf-8 -*-
 from typing import Annotated
 
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Request, Response
 
+from backend.common.cache import etag
 from backend.common.security.jwt import CurrentUser, DependsJwtAuth
-from backend.common.pagination import paging_data, DependsPagination, PageData
-from backend.common.response.response_schema import response_base, ResponseModel, ResponseSchemaModel
-from backend.database.db import CurrentSession
+from backend.common.pagination import DependsPagination, PageDataStruct
+from backend.common.response.response_schema import response_base, ResponseModel, ResponseStructModel
+from backend.utils.openapi import struct_response_schema
 from backend.app.admin.schema.user import (
     RegisterUserParam,
-    GetUserInfoDetail,
+    GetUserInfoDetailStruct,
     ResetPassword,
     UpdateUserParam,
     AvatarParam,
 )
-from backend.app.admin.service.user_service import UserService
+from backend.app.admin.service.user_service import USER_LIST_CACHE_TAG, UserService, user_cache_tag
 
 router = APIRouter()
 
@@ -34,10 +35,16 @@ async def password_reset(obj: ResetPassword) -> ResponseModel:
     return response_base.fail()
 
 
-@router.get('/{username}', summary='View user info', dependencies=[DependsJwtAuth])
-async def get_user(username: str) -> ResponseSchemaModel[GetUserInfoDetail]:
-    data = await UserService.get_userinfo(username=username)
-    return response_base.success(data=data)
+@router.get(
+    '/{username}',
+    summary='View user info',
+    dependencies=[DependsJwtAuth],
+    openapi_extra=struct_response_schema(ResponseStructModel[GetUserInfoDetailStruct]),
+)
+@etag(tags=lambda username: [user_cache_tag(username)])
+async def get_user(request: Request, username: str) -> Response:
+    data = await UserService.get_userinfo_struct(username=username)
+    return response_base.fast_success(data=data)
 
 
 @router.put('/{username}', summary='Update user info', dependencies=[DependsJwtAuth])
@@ -63,16 +70,17 @@ async def update_avatar(username: str, avatar: AvatarParam) -> ResponseModel:
         DependsJwtAuth,
         DependsPagination,
     ],
+    openapi_extra=struct_response_schema(ResponseStructModel[PageDataStruct[GetUserInfoDetailStruct]]),
 )
+@etag(tags=[USER_LIST_CACHE_TAG])
 async def get_all_users(
-    db: CurrentSession,
+    request: Request,
     username: Annotated[str | None, Query()] = None,
     phone: Annotated[str | None, Query()] = None,
     status: Annotated[int | None, Query()] = None,
-) -> ResponseSchemaModel[PageData[GetUserInfoDetail]]:
-    user_select = await UserService.get_select(username=username, phone=phone, status=status)
-    page_data = await paging_data(db, user_select)
-    return response_base.success(data=page_data)
+) -> Response:
+    page_data = await UserService.get_list(request=request, username=username, phone=phone, status=status)
+    return response_base.fast_success(data=page_data)
 
 
 @router.delete(
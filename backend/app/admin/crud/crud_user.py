@@ -1,19 +1,30 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from datetime import datetime
+from functools import cached_property
 
 import bcrypt
-from sqlalchemy import select, update, desc, and_
+from sqlalchemy import Row, select, update, desc, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import Select
 from sqlalchemy_crud_plus import CRUDPlus
 
 from backend.app.admin.model import User
-from backend.app.admin.schema.user import RegisterUserParam, UpdateUserParam, AvatarParam
-from backend.common.security.jwt import get_hash_password
+from backend.app.admin.schema.user import RegisterUserParam, UpdateUserParam, AvatarParam, GetUserInfoDetail
+from backend.common.security.password import get_hash_password
 
 
 class CRUDUser(CRUDPlus[User]):
+    @cached_property
+    def detail_columns(self) -> tuple:
+        """
+        Columns required by the user detail schema, used by read-only queries to avoid loading
+        the full entity (password, salt) and ORM instance state
+
+        :return:
+        """
+        return tuple(getattr(self.model, field) for field in GetUserInfoDetail.model_fields)
+
     async def get(self, db: AsyncSession, user_id: int) -> User | None:
         """
         Get user
@@ -34,6 +45,18 @@ class CRUDUser(CRUDPlus[User]):
         """
         return await self.select_model_by_column(db, username=username)
 
+    async def get_detail_by_username(self, db: AsyncSession, username: str) -> Row | None:
+        """
+        Get user detail columns by username
+
+        :param db:
+        :param username:
+        :return:
+        """
+        stmt = select(*self.detail_columns).where(self.model.username == username)
+        result = await db.execute(stmt)
+        return result.first()
+
     async def update_login_time(self, db: AsyncSession, username: str, login_time: datetime) -> int:
         user = await db.execute(
             update(self.model).where(self.model.username == username).values(last_login_time=login_time)
@@ -117,7 +140,7 @@ class CRUDUser(CRUDPlus[User]):
         :param status:
         :return:
         """
-        stmt = select(self.model).order_by(desc(self.model.join_time))
+        stmt = select(*self.detail_columns).order_by(desc(self.model.join_time))
 
         filters = []
         if username:
@@ -0,0 +1,11 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from pydantic import Field
+
+from backend.common.schema import SchemaBase
+
+
+class GetProfileDetail(SchemaBase):
+    file: str = Field(description='Profile file name in the log/profile directory')
+    seconds: float = Field(description='Profiled time')
+    samples: int = Field(description='Number of stack samples')
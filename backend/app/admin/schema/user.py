@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from datetime import datetime
+from typing import Annotated, Any, Mapping
 
+from msgspec import Meta, Struct
 from pydantic import Field, EmailStr, ConfigDict, HttpUrl
 
 from backend.common.schema import SchemaBase, CustomPhoneNumber
+from backend.utils.serializers import format_datetime
 
 
 class AuthSchemaBase(SchemaBase):
@@ -42,6 +45,51 @@ class GetUserInfoDetail(UpdateUserParam):
     last_login_time: datetime | None = Field(None, description='Last login time')
 
 
+class GetUserInfoSnapshot(Struct, array_like=True):
+    """User detail snapshot for cache values, encoded as an array in the field order of GetUserInfoDetail"""
+
+    username: str
+    email: str
+    phone: str | None
+    id: int
+    uuid: str
+    avatar: str | None
+    status: int
+    is_superuser: bool
+    join_time: datetime
+    last_login_time: datetime | None
+
+
+class GetUserInfoDetailStruct(Struct):
+    """User detail response, encoded by msgspec without pydantic validation, time fields are preformatted"""
+
+    username: Annotated[str, Meta(description='Username')]
+    email: Annotated[str, Meta(description='Email')]
+    phone: Annotated[str | None, Meta(description='Phone number')]
+    id: Annotated[int, Meta(description='User ID')]
+    uuid: Annotated[str, Meta(description='User UUID')]
+    avatar: Annotated[str | None, Meta(description='Avatar')]
+    status: Annotated[int, Meta(description='Status')]
+    is_superuser: Annotated[bool, Meta(description='Is superuser')]
+    join_time: Annotated[str, Meta(description='Join time')]
+    last_login_time: Annotated[str | None, Meta(description='Last login time')]
+
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any]) -> 'GetUserInfoDetailStruct':
+        """
+        Build from the values of a row by field name
+
+        :param row: ``_mapping`` of a detail columns query row, or ``msgspec.structs.asdict`` of a snapshot
+        :return:
+        """
+        last_login_time = row['last_login_time']
+        return cls(**{
+            **row,
+            'join_time': format_datetime(row['join_time']),
+            'last_login_time': format_datetime(last_login_time) if last_login_time else None,
+        })
+
+
 class ResetPassword(SchemaBase):
     username: str = Field(description='Username')
     old_password: str = Field(description='Old password')
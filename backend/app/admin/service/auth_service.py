@@ -8,15 +8,28 @@ from backend.app.admin.crud.crud_user import user_dao
 from backend.app.admin.model import User
 from backend.app.admin.schema.token import GetLoginToken
 from backend.app.admin.schema.user import AuthLoginParam
+from backend.app.admin.service.user_service import USER_LIST_CACHE_TAG, user_cache_tag
+from backend.common.cache import response_cache
 from backend.common.exception import errors
 from backend.common.response.response_code import CustomErrorCode
-from backend.common.security.jwt import password_verify, create_access_token
+from backend.common.security.jwt import create_access_token
+from backend.common.security.password import password_verify
 from backend.core.conf import settings
 from backend.database.db import async_db_session
-from backend.database.redis import redis_client
+from backend.database.redis import get_redis_client, redis_key
 from backend.utils.timezone import timezone
 
 
+async def invalidate_login_time(username: str) -> None:
+    """
+    Drop the cached responses showing the last login time of a user, which also changes their ETag
+
+    :param username:
+    :return:
+    """
+    await response_cache.invalidate_tags(USER_LIST_CACHE_TAG, user_cache_tag(username))
+
+
 class AuthService:
     @staticmethod
     async def user_verify(db: AsyncSession, username: str, password: str) -> User:
@@ -33,15 +46,17 @@ class AuthService:
         async with async_db_session() as db:
             user = await self.user_verify(db, form_data.username, form_data.password)
             await user_dao.update_login_time(db, user.username, login_time=timezone.now())
-            token = create_access_token(str(user.id))
-            return token, user
+            await db.commit()
+        await invalidate_login_time(user.username)
+        token = create_access_token(str(user.id))
+        return token, user
 
     async def login(self, *, request: Request, obj: AuthLoginParam) -> GetLoginToken:
         async with async_db_session() as db:
             user = await self.user_verify(db, obj.username, obj.password)
             try:
                 captcha_uuid = request.app.state.captcha_uuid
-                redis_code = await redis_client.get(f'{settings.CAPTCHA_LOGIN_REDIS_PREFIX}:{captcha_uuid}')
+                redis_code = await get_redis_client().get(redis_key(settings.CAPTCHA_LOGIN_REDIS_PREFIX, captcha_uuid))
                 if not redis_code:
                     raise errors.ForbiddenError(msg='Captcha expired, please retrieve it again')
             except AttributeError:
@@ -49,9 +64,11 @@ class AuthService:
             if redis_code.lower() != obj.captcha.lower():
                 raise errors.CustomError(error=CustomErrorCode.CAPTCHA_ERROR)
             await user_dao.update_login_time(db, user.username, login_time=timezone.now())
-            token = create_access_token(str(user.id))
-            data = GetLoginToken(access_token=token, user=user)
-            return data
+            await db.commit()
+        await invalidate_login_time(user.username)
+        token = create_access_token(str(user.id))
+        data = GetLoginToken(access_token=token, user=user)
+        return data
 
 
 auth_service: AuthService = AuthService()
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+
+from starlette.concurrency import run_in_threadpool
+
+from backend.app.admin.model import User
+from backend.app.admin.schema.monitor import GetProfileDetail
+from backend.common.exception import errors
+from backend.common.profiler import ProfileFormat, SamplingProfiler
+from backend.common.security.jwt import superuser_verify
+
+
+class MonitorService:
+    @staticmethod
+    async def profile(*, current_user: User, seconds: float, profile_format: ProfileFormat) -> GetProfileDetail:
+        superuser_verify(current_user)
+        profiler = SamplingProfiler(name='worker')
+        if not profiler.start():
+            raise errors.RequestError(msg='This worker is already being profiled, please try again later')
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.stop()
+        filename = profiler.filename(profile_format)
+        await run_in_threadpool(profiler.write, filename)
+        return GetProfileDetail(
+            file=filename,
+            seconds=profiler.end_time - profiler.start_time,
+            samples=sum(profiler.samples.values()),
+        )
@@ -1,13 +1,38 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-from sqlalchemy import Select
+from fastapi import Request
+from msgspec import structs
 
+from backend.common.cache import cached, response_cache
 from backend.common.exception import errors
-from backend.common.security.jwt import superuser_verify, password_verify, get_hash_password
+from backend.common.pagination import PageDataStruct, paging_struct
+from backend.common.security.jwt import superuser_verify
+from backend.common.security.password import password_verify, get_hash_password
 from backend.app.admin.crud.crud_user import user_dao
 from backend.database.db import async_db_session
 from backend.app.admin.model import User
-from backend.app.admin.schema.user import RegisterUserParam, ResetPassword, UpdateUserParam, AvatarParam
+from backend.app.admin.schema.user import (
+    RegisterUserParam,
+    ResetPassword,
+    UpdateUserParam,
+    AvatarParam,
+    GetUserInfoSnapshot,
+    GetUserInfoDetailStruct,
+)
+
+
+# Response cache tag of the user list
+USER_LIST_CACHE_TAG = 'user:list'
+
+
+def user_cache_tag(username: str) -> str:
+    """
+    Response cache tag of the user detail
+
+    :param username:
+    :return:
+    """
+    return f'user:{username}'
 
 
 class UserService:
@@ -23,6 +48,7 @@ class UserService:
             if email:
                 raise errors.ForbiddenError(msg='Email already registered')
             await user_dao.create(db, obj)
+        await response_cache.invalidate_tags(USER_LIST_CACHE_TAG, user_cache_tag(obj.username))
 
     @staticmethod
     async def pwd_reset(*, obj: ResetPassword) -> int:
@@ -36,15 +62,22 @@ class UserService:
                 raise errors.ForbiddenError(msg='Passwords do not match')
             new_pwd = get_hash_password(obj.new_password, user.salt)
             count = await user_dao.reset_password(db, user.id, new_pwd)
-            return count
+        await response_cache.invalidate_tags(USER_LIST_CACHE_TAG, user_cache_tag(obj.username))
+        return count
 
     @staticmethod
-    async def get_userinfo(*, username: str) -> User:
+    @cached(tags=lambda username: [user_cache_tag(username)], schema=GetUserInfoSnapshot)
+    async def get_userinfo(*, username: str) -> GetUserInfoSnapshot:
         async with async_db_session() as db:
-            user = await user_dao.get_by_username(db, username)
+            user = await user_dao.get_detail_by_username(db, username)
             if not user:
                 raise errors.NotFoundError(msg='User does not exist')
-            return user
+            return GetUserInfoSnapshot(**user._mapping)
+
+    @staticmethod
+    async def get_userinfo_struct(*, username: str) -> GetUserInfoDetailStruct:
+        snapshot = await UserService.get_userinfo(username=username)
+        return GetUserInfoDetailStruct.from_row(structs.asdict(snapshot))
 
     @staticmethod
     async def update(*, username: str, obj: UpdateUserParam) -> int:
@@ -62,7 +95,10 @@ class UserService:
                 if email:
                     raise errors.ForbiddenError(msg='Email already registered')
             count = await user_dao.update_userinfo(db, input_user.id, obj)
-            return count
+        await response_cache.invalidate_tags(
+            USER_LIST_CACHE_TAG, user_cache_tag(username), user_cache_tag(obj.username)
+        )
+        return count
 
     @staticmethod
     async def update_avatar(*, username: str, avatar: AvatarParam) -> int:
@@ -71,11 +107,23 @@ class UserService:
             if not input_user:
                 raise errors.NotFoundError(msg='User does not exist')
             count = await user_dao.update_avatar(db, input_user.id, avatar)
-            return count
+        await response_cache.invalidate_tags(USER_LIST_CACHE_TAG, user_cache_tag(username))
+        return count
 
     @staticmethod
-    async def get_select(*, username: str = None, phone: str = None, status: int = None) -> Select:
-        return await user_dao.get_list(username=username, phone=phone, status=status)
+    @cached(tags=[USER_LIST_CACHE_TAG], schema=PageDataStruct[GetUserInfoDetailStruct])
+    async def get_list(
+        *, request: Request, username: str = None, phone: str = None, status: int = None
+    ) -> PageDataStruct[GetUserInfoDetailStruct]:
+        # The request only takes part in the cache key, its query holds the page params. The load may run in a
+        # background refresh after the request has ended, so it opens its own session
+        async with async_db_session() as db:
+            user_select = await user_dao.get_list(username=username, phone=phone, status=status)
+            return await paging_struct(
+                db,
+                user_select,
+                transformer=lambda rows: [GetUserInfoDetailStruct.from_row(row._mapping) for row in rows],
+            )
 
     @staticmethod
     async def delete(*, current_user: User, username: str) -> int:
@@ -85,5 +133,5 @@ class UserService:
             if not input_user:
                 raise errors.NotFoundError(msg='User does not exist')
             count = await user_dao.delete(db, input_user.id)
-            return count
-
+        await response_cache.invalidate_tags(USER_LIST_CACHE_TAG, user_cache_tag(username))
+        return count
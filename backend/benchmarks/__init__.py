@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro benchmarks, run from the project root directory, e.g. ``python -m backend.benchmarks.read_model``
+"""
+
+import time
+import tracemalloc
+
+from typing import Any, Callable, Coroutine
+
+
+def bench(name: str, func: Callable[[], Any], *, number: int = 1000, trace: bool = True) -> dict[str, float]:
+    """
+    Run a function repeatedly and print time and allocations per call
+
+    :param name: Benchmark name
+    :param func: Function to benchmark
+    :param number: Number of calls
+    :param trace: Whether to record allocations with tracemalloc (slows down the calls)
+    :return:
+    """
+    func()  # warm up
+    start = time.perf_counter_ns()
+    for _ in range(number):
+        func()
+    per_call_us = (time.perf_counter_ns() - start) / number / 1000
+    result = {'time_us': per_call_us}
+    if trace:
+        tracemalloc.start()
+        retained = func()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del retained
+        result['retained_kib'] = current / 1024
+        result['peak_kib'] = peak / 1024
+    print(f'{name: <40} | ' + ' | '.join(f'{k}={v:,.1f}' for k, v in result.items()))
+    return result
+
+
+def run_sync(coro: Coroutine) -> Any:
+    """
+    Drive a coroutine that never suspends, without the event loop overhead
+
+    :param coro:
+    :return:
+    """
+    try:
+        coro.send(None)
+    except StopIteration as e:
+        return e.value
+    raise RuntimeError('Coroutine suspended')
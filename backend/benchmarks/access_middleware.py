@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-request overhead of the access log middleware, BaseHTTPMiddleware vs pure ASGI, text vs batched JSON lines, on a
+trivial ASGI app
+
+The log goes to a sink that drops messages, so the numbers include record creation and formatting but no I/O
+
+Usage: python -m backend.benchmarks.access_middleware
+"""
+
+import asyncio
+
+from fastapi import Request, Response
+from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from starlette.types import Receive, Scope, Send
+
+from backend.benchmarks import bench
+from backend.common.log import log
+from backend.middleware.access_middle import AccessMiddleware
+from backend.utils.timezone import timezone
+
+SCOPE = {
+    'type': 'http',
+    'asgi': {'version': '3.0'},
+    'http_version': '1.1',
+    'method': 'GET',
+    'scheme': 'http',
+    'path': '/api/v1/users/admin',
+    'raw_path': b'/api/v1/users/admin',
+    'query_string': b'',
+    'root_path': '',
+    'headers': [(b'host', b'127.0.0.1:8000')],
+    'client': ('127.0.0.1', 50000),
+    'server': ('127.0.0.1', 8000),
+}
+
+
+class BaseHTTPAccessMiddleware(BaseHTTPMiddleware):
+    # Previous AccessMiddleware
+    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
+        start_time = timezone.now()
+        response = await call_next(request)
+        end_time = timezone.now()
+        log.info(
+            f'{request.client.host: <15} | {request.method: <8} | {response.status_code: <6} | '
+            f'{request.url.path} | {round((end_time - start_time).total_seconds(), 3) * 1000.0}ms'
+        )
+        return response
+
+
+async def app(scope: Scope, receive: Receive, send: Send) -> None:
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-length', b'2')]})
+    await send({'type': 'http.response.body', 'body': b'{}'})
+
+
+def receiver() -> Receive:
+    messages = iter(({'type': 'http.request', 'body': b'', 'more_body': False},))
+
+    async def receive() -> dict:
+        return next(messages, {'type': 'http.disconnect'})
+
+    return receive
+
+
+async def send(message: dict) -> None:
+    pass
+
+
+def main() -> None:
+    log.remove()
+    loop = asyncio.new_event_loop()
+    cases = {
+        'no middleware': app,
+        'BaseHTTPMiddleware': BaseHTTPAccessMiddleware(app),
+        'pure ASGI': AccessMiddleware(app),
+        'pure ASGI, 10% sampled': AccessMiddleware(app, sample_rate=0.1),
+        'pure ASGI, json': AccessMiddleware(app, log_format='json'),
+        'pure ASGI, json, 1% sampled': AccessMiddleware(app, sample_rate=0.01, log_format='json'),
+    }
+    for level in ('INFO', 'WARNING'):
+        handler_id = log.add(lambda message: None, level=level)
+        print(f'sink level {level}')
+        for name, asgi_app in cases.items():
+            bench(f'  {name}', lambda: loop.run_until_complete(asgi_app(dict(SCOPE), receiver(), send)), number=5000)
+        log.remove(handler_id)
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache value size and encode/decode speed, JSON strings vs typed msgpack Structs
+
+Usage: python -m backend.benchmarks.cache_codec
+"""
+
+import json as std_json
+
+from msgspec import json, structs
+
+from backend.app.admin.schema.user import GetUserInfoSnapshot
+from backend.benchmarks import bench
+from backend.utils.serializers import MsgpackCodec
+from backend.utils.timezone import timezone
+
+
+def main() -> None:
+    now = timezone.now().replace(tzinfo=None)
+    snapshots = [
+        GetUserInfoSnapshot(f'user{i}', f'user{i}@example.com', '13800000000', i, f'uuid-{i}', None, 1, False, now, now)
+        for i in range(100)
+    ]
+    cases = {'user snapshot': snapshots[0], '100-row page': snapshots}
+
+    for name, value in cases.items():
+        items = [structs.asdict(item) for item in value] if isinstance(value, list) else structs.asdict(value)
+        std_str = std_json.dumps(items, default=str)
+        msgspec_json = json.encode(items)
+        codec = MsgpackCodec(list[GetUserInfoSnapshot] if isinstance(value, list) else GetUserInfoSnapshot)
+        packed = codec.encode(value)
+
+        print(f'{name}: json={len(std_str.encode())} B, msgspec json={len(msgspec_json)} B, msgpack={len(packed)} B')
+        bench('  json.dumps', lambda: std_json.dumps(items, default=str), number=2000, trace=False)
+        bench('  json.loads', lambda: std_json.loads(std_str), number=2000, trace=False)
+        bench('  msgspec json encode', lambda: json.encode(items), number=2000, trace=False)
+        bench('  msgspec json decode', lambda: json.decode(msgspec_json), number=2000, trace=False)
+        bench('  msgpack Struct encode', lambda: codec.encode(value), number=2000, trace=False)
+        bench('  msgpack Struct decode', lambda: codec.decode(packed), number=2000, trace=False)
+
+
+if __name__ == '__main__':
+    main()
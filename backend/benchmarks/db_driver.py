@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MySQL driver benchmark, runs the same CRUDUser workload mix against each driver
+
+Start a local MySQL container first, the connection uses the database settings in ``.env``::
+
+    docker run -d --name fsm_bench_mysql -p 3306:3306 -e MYSQL_ROOT_PASSWORD=123456 -e MYSQL_DATABASE=fsm mysql:8.0.29
+
+Usage: python -m backend.benchmarks.db_driver --requests 5000 --concurrency 32 --drivers asyncmy aiomysql pymysql
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import random
+import statistics
+import time
+
+from typing import Awaitable, Iterable
+
+from sqlalchemy import create_engine, delete, desc, insert, select, update
+from sqlalchemy.orm import Session
+
+from backend.app.admin.crud.crud_user import user_dao
+from backend.app.admin.model import User
+from backend.database.db import create_async_engine_and_session, create_database_url
+from backend.utils.timezone import timezone
+
+USERNAME_PREFIX = 'bench_'
+SEED_USERS = 1000
+PAGE_SIZE = 20
+
+# Workload mix: lookup by username, paged list, update
+WORKLOAD = ('lookup',) * 7 + ('page',) * 2 + ('update',)
+
+
+def _seed_rows() -> list[dict]:
+    return [
+        {
+            'uuid': f'{USERNAME_PREFIX}{i}',
+            'username': f'{USERNAME_PREFIX}{i}',
+            'password': '$2b$12$' + 'x' * 53,
+            'salt': b's' * 29,
+            'email': f'{USERNAME_PREFIX}{i}@example.com',
+            'join_time': timezone.now(),
+        }
+        for i in range(SEED_USERS)
+    ]
+
+
+def _page_stmt():
+    offset = random.randrange(0, SEED_USERS - PAGE_SIZE)
+    return (
+        select(*user_dao.detail_columns)
+        .where(User.username.like(f'{USERNAME_PREFIX}%'))
+        .order_by(desc(User.join_time))
+        .limit(PAGE_SIZE)
+        .offset(offset)
+    )
+
+
+def _random_username() -> str:
+    return f'{USERNAME_PREFIX}{random.randrange(SEED_USERS)}'
+
+
+async def _timed(queries: Iterable[Awaitable[float]]) -> tuple[list[float], float, float]:
+    """
+    Run the queries, timed after the table is seeded and before it is cleaned up
+
+    :param queries:
+    :return: Latencies in seconds, CPU time and wall time of the run
+    """
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    latencies = await asyncio.gather(*queries)
+    return latencies, time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+
+async def _run_async(driver: str, total: int, concurrency: int) -> tuple[list[float], float, float]:
+    engine, db_session = create_async_engine_and_session(create_database_url(driver))
+    async with engine.begin() as conn:
+        await conn.run_sync(User.__table__.create, checkfirst=True)
+        await conn.execute(delete(User).where(User.username.like(f'{USERNAME_PREFIX}%')))
+        await conn.execute(insert(User), _seed_rows())
+
+    async def one(op: str) -> float:
+        start = time.perf_counter()
+        async with db_session.begin() as db:
+            if op == 'lookup':
+                await user_dao.get_by_username(db, _random_username())
+            elif op == 'page':
+                (await db.execute(_page_stmt())).all()
+            else:
+                await user_dao.update_login_time(db, _random_username(), timezone.now())
+        return time.perf_counter() - start
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(op: str) -> float:
+        async with semaphore:
+            return await one(op)
+
+    try:
+        return await _timed(limited(random.choice(WORKLOAD)) for _ in range(total))
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(delete(User).where(User.username.like(f'{USERNAME_PREFIX}%')))
+        await engine.dispose()
+
+
+async def _run_threaded(driver: str, total: int, concurrency: int) -> tuple[list[float], float, float]:
+    engine = create_engine(create_database_url(driver), pool_size=concurrency, max_overflow=0, pool_pre_ping=True)
+    with engine.begin() as conn:
+        User.__table__.create(conn, checkfirst=True)
+        conn.execute(delete(User).where(User.username.like(f'{USERNAME_PREFIX}%')))
+        conn.execute(insert(User), _seed_rows())
+
+    def one(op: str) -> float:
+        start = time.perf_counter()
+        with Session(engine) as db, db.begin():
+            if op == 'lookup':
+                db.scalars(select(User).where(User.username == _random_username())).first()
+            elif op == 'page':
+                db.execute(_page_stmt()).all()
+            else:
+                db.execute(
+                    update(User).where(User.username == _random_username()).values(last_login_time=timezone.now())
+                )
+        return time.perf_counter() - start
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(op: str) -> float:
+        async with semaphore:
+            return await asyncio.to_thread(one, op)
+
+    try:
+        return await _timed(limited(random.choice(WORKLOAD)) for _ in range(total))
+    finally:
+        with engine.begin() as conn:
+            conn.execute(delete(User).where(User.username.like(f'{USERNAME_PREFIX}%')))
+        engine.dispose()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--drivers', nargs='+', default=['asyncmy', 'aiomysql', 'pymysql'])
+    args = parser.parse_args()
+
+    print(f'{"driver": <10} | {"qps": >9} | {"p50 ms": >8} | {"p99 ms": >8} | {"cpu us/query": >12}')
+    for driver in args.drivers:
+        if importlib.util.find_spec(driver) is None:
+            print(f'{driver: <10} | not installed, skipped')
+            continue
+        runner = _run_threaded if driver == 'pymysql' else _run_async
+        latencies, cpu, wall = await runner(driver, args.requests, args.concurrency)
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        print(
+            f'{driver: <10} | {len(latencies) / wall: >9.1f} | {statistics.median(latencies) * 1000: >8.2f} | '
+            f'{p99 * 1000: >8.2f} | {cpu / len(latencies) * 1e6: >12.1f}'
+        )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Import time budget of the application, from ``python -X importtime -c 'import backend.main'`` in fresh interpreters
+
+Prints the median import time, the peak RSS after the import and the packages with the most import time. Exits with
+status 1 when the median exceeds the budget or when a module that is meant to be imported on first use is imported at
+startup. backend/tests/test_import_time.py runs the same checks, the budget one only with IMPORT_TIME_BUDGET_MS set
+
+Usage: python -m backend.benchmarks.import_time [--budget-ms 2000] [--runs 5]
+"""
+
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+
+from collections import defaultdict
+
+from backend.core.path_conf import BASE_PATH
+
+# Imported on first use, by the captcha route and the password hashing
+DEFERRED_MODULES = ('fast_captcha', 'PIL', 'pwdlib')
+
+# Median import time of backend.main, in ms
+BUDGET_MS = 2000
+
+_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)')
+
+_PROGRAM = (
+    'import resource, sys\n'
+    'import backend.main\n'
+    'print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n'
+    'print(" ".join(sorted(m for m in sys.modules if m.split(".")[0] in {deferred!r})))\n'
+)
+
+
+def run_once() -> tuple[float, dict[str, int], int, list[str]]:
+    """
+    Import the application in a fresh interpreter
+
+    :return: Total import time in ms, self time per top level package in us, peak RSS in KiB, deferred modules found
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _PROGRAM.format(deferred=set(DEFERRED_MODULES))],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=BASE_PATH.parent,
+    )
+    total_us = 0
+    packages: dict[str, int] = defaultdict(int)
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        packages[name.split('.')[0]] += int(self_us)
+        if name == 'backend.main' and not indent:
+            total_us = int(cumulative_us)
+    rss, deferred = result.stdout.splitlines()
+    return total_us / 1000, packages, int(rss), deferred.split()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    total_ms = statistics.median(run[0] for run in runs)
+    _, packages, rss, deferred = runs[-1]
+
+    print(f'import backend.main | median {total_ms:,.0f}ms of {args.runs} runs | peak RSS {rss / 1024:,.1f}MiB')
+    for name, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:15]:
+        print(f'  {name:<30} | {self_us / 1000:,.1f}ms')
+
+    failed = False
+    if total_ms > args.budget_ms:
+        print(f'Import time {total_ms:,.0f}ms exceeds the budget of {args.budget_ms:,.0f}ms')
+        failed = True
+    if deferred:
+        print(f'Imported at startup, meant to be imported on first use: {", ".join(deferred)}')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Speed of MsgSpecJSONResponse as the default response class, its parity with JSONResponse is checked by
+backend/tests/test_json_response.py
+
+Usage: python -m backend.benchmarks.json_response
+"""
+
+from datetime import datetime
+from typing import Any
+from uuid import UUID
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from backend.app.admin.schema.user import GetUserInfoDetail
+from backend.benchmarks import bench, run_sync
+from backend.common.pagination import PageData
+from backend.common.response.response_schema import ResponseSchemaModel, response_base
+from backend.core.conf import settings
+from backend.utils.serializers import MsgSpecJSONResponse, format_datetime
+
+
+def _user(i: int, **kwargs) -> dict[str, Any]:
+    now = datetime(2024, 2, 29, 23, 59, 59, 999999)
+    user = {
+        'username': f'用户{i}',
+        'email': f'user{i}@example.com',
+        'phone': None,
+        'id': i,
+        'uuid': str(UUID(int=i)),
+        'avatar': 'https://example.com/"avatar"\n.png',
+        'status': 1,
+        'is_superuser': i % 2 == 0,
+        'join_time': now,
+        'last_login_time': None,
+    }
+    return {**user, **kwargs}
+
+
+def _serialize(type_: Any, content: Any) -> Any:
+    field = create_response_field('parity', type_)
+    return run_sync(serialize_response(field=field, response_content=content))
+
+
+def main() -> None:
+    page = _serialize(
+        ResponseSchemaModel[PageData[GetUserInfoDetail]],
+        response_base.success(
+            data={
+                'items': [_user(i) for i in range(100)],
+                'total': 100,
+                'page': 1,
+                'size': 100,
+                'total_pages': 1,
+                'links': {'first': '', 'last': '', 'self': ''},
+            }
+        ),
+    )
+    dt = datetime(2024, 1, 1, 8, 30, 1)
+    bench('100-row page: JSONResponse', lambda: JSONResponse(page), number=2000)
+    bench('100-row page: MsgSpecJSONResponse', lambda: MsgSpecJSONResponse(page), number=2000)
+    bench('datetime: strftime', lambda: dt.strftime(settings.DATETIME_FORMAT), number=100000, trace=False)
+    bench('datetime: format_datetime', lambda: format_datetime(dt), number=100000, trace=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Throughput of standard library records through InterceptHandler, and of a rotating file sink with inline vs
+background compression, whose slowest call is the one that rotates
+
+Usage: python -m backend.benchmarks.log_throughput
+"""
+
+import inspect
+import logging
+import tempfile
+import time
+
+from pathlib import Path
+
+from backend.benchmarks import bench
+from backend.common.log import InterceptHandler, _compression_executor, compress_in_background, log
+
+RECORDS = 200_000
+
+
+class PreviousInterceptHandler(logging.Handler):
+    def emit(self, record: logging.LogRecord):
+        try:
+            level = log.level(record.levelname).name
+        except ValueError:
+            level = record.levelno
+        frame, depth = inspect.currentframe(), 0
+        while frame and (depth == 0 or frame.f_code.co_filename == logging.__file__):
+            frame = frame.f_back
+            depth += 1
+        log.opt(depth=depth, exception=record.exc_info).log(level, record.getMessage())
+
+
+def intercept() -> None:
+    stdlib_logger = logging.getLogger('sqlalchemy.engine.Engine')
+    stdlib_logger.propagate = False
+    stdlib_logger.setLevel(logging.DEBUG)
+    handlers = {
+        'previous': PreviousInterceptHandler(),
+        'cached, INFO handler level': InterceptHandler(logging.INFO),
+    }
+    sink_id = log.add(lambda message: None, level='INFO', format='{message}')
+    for name, handler in handlers.items():
+        stdlib_logger.handlers = [handler]
+        bench(f'{name}: info', lambda: stdlib_logger.info('SELECT %s', 1), number=20000, trace=False)
+        bench(f'{name}: debug (dropped)', lambda: stdlib_logger.debug('SELECT %s', 1), number=20000, trace=False)
+    log.remove(sink_id)
+    stdlib_logger.handlers = []
+
+
+def file_sink() -> None:
+    for name, compression in (('inline tar.gz', 'tar.gz'), ('background tar.gz', compress_in_background)):
+        with tempfile.TemporaryDirectory() as directory:
+            sink_id = log.add(
+                str(Path(directory) / 'access.log'),
+                level='INFO',
+                format='{time:YYYY-MM-DD HH:mm:ss.SSS} | {level: <8} | {message}',
+                rotation='5 MB',
+                compression=compression,
+            )
+            slowest = 0.0
+            start = time.perf_counter()
+            for i in range(RECORDS):
+                call_start = time.perf_counter()
+                log.info('127.0.0.1       | GET      | 200    | /api/v1/users/{} | 1.234ms', i)
+                slowest = max(slowest, time.perf_counter() - call_start)
+            elapsed = time.perf_counter() - start
+            log.remove(sink_id)
+            # Let background compression finish before the directory is removed
+            _compression_executor.submit(lambda: None).result()
+            print(f'file sink, {name:<20} | {RECORDS / elapsed:,.0f} records/s | slowest call {slowest * 1000:.1f}ms')
+
+
+def main() -> None:
+    log.remove()
+    intercept()
+    file_sink()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Several worker processes logging to the same rotating access log, each with its own loguru file sink vs through the
+log writer process. Lines found in the log files and their compressed rotations are counted against lines logged
+
+Usage: python -m backend.benchmarks.log_writer
+"""
+
+import multiprocessing
+import os
+import tarfile
+import tempfile
+import time
+
+from pathlib import Path
+
+from loguru import logger
+
+from backend.common import log_writer
+from backend.common.log import _compression_executor, file_sink_config
+from backend.core import path_conf
+from backend.core.conf import settings
+
+WORKERS = 4
+LINES = 100_000
+LINE = '127.0.0.1       | GET      | 200    | /api/v1/users/{} | 1.234ms'
+
+_fork = multiprocessing.get_context('fork')
+
+
+def count_lines(directory: str) -> int:
+    lines = 0
+    for path in Path(directory).iterdir():
+        if path.name.endswith('.tar.gz'):
+            with tarfile.open(path) as f:
+                for member in f.getmembers():
+                    lines += f.extractfile(member).read().count(b'\n')
+        elif path.name.endswith('.log'):
+            lines += path.read_bytes().count(b'\n')
+    return lines
+
+
+def own_sink_worker(directory: str) -> None:
+    logger.remove()
+    logger.add(
+        os.path.join(directory, settings.LOG_ACCESS_FILENAME),
+        format=settings.LOG_FILE_FORMAT,
+        enqueue=True,
+        **file_sink_config(),
+    )
+    for i in range(LINES):
+        logger.info(LINE, i)
+    logger.remove()
+    _compression_executor.submit(lambda: None).result()
+
+
+def writer_worker(directory: str) -> None:
+    path_conf.LOG_DIR = Path(directory)
+    logger.remove()
+    client = log_writer.LogWriterClient(str(Path(directory) / 'log_writer.sock'))
+    logger.add(client.sink('access'), format=settings.LOG_FILE_FORMAT)
+    for i in range(LINES):
+        logger.info(LINE, i)
+    logger.remove()
+
+
+def writer(directory: str) -> None:
+    path_conf.LOG_DIR = Path(directory)
+    log_writer.run_writer(str(Path(directory) / 'log_writer.sock'))
+
+
+def run(target, directory: str) -> float:
+    start = time.perf_counter()
+    workers = [_fork.Process(target=target, args=(directory,)) for _ in range(WORKERS)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    return elapsed
+
+
+def report(name: str, elapsed: float, directory: str) -> None:
+    logged = WORKERS * LINES
+    print(f'{name:<15} | {logged / elapsed:,.0f} lines/s | {count_lines(directory):,} of {logged:,} lines kept')
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        elapsed = run(own_sink_worker, directory)
+        report('sink per worker', elapsed, directory)
+
+    with tempfile.TemporaryDirectory() as directory:
+        process = _fork.Process(target=writer, args=(directory,))
+        process.start()
+        while not (Path(directory) / 'log_writer.sock').exists():
+            time.sleep(0.01)
+        elapsed = run(writer_worker, directory)
+        log_writer.stop_writer(process)
+        report('log writer', elapsed, directory)
+
+
+if __name__ == '__main__':
+    main()
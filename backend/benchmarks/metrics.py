@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Recording cost of the multi-process metrics and the merge of values written by forked workers
+
+Values are written to a temporary METRICS_DIR
+
+Usage: python -m backend.benchmarks.metrics
+"""
+
+import os
+import tempfile
+
+from backend.benchmarks import bench
+from backend.core.conf import settings
+
+settings.METRICS_DIR = tempfile.mkdtemp(prefix='fsm_metrics_')
+
+from backend.common import metrics  # noqa: E402
+
+WORKERS = 4
+REQUESTS = 1000
+
+
+def check_multiprocess() -> None:
+    metrics.clear_metrics_dir()
+    pids = []
+    for _ in range(WORKERS):
+        pid = os.fork()
+        if pid == 0:
+            for i in range(REQUESTS):
+                metrics.HTTP_REQUESTS.labels('GET', '/api/v1/users/{username}', 200).inc()
+                metrics.HTTP_REQUEST_DURATION.labels('GET', '/api/v1/users/{username}').observe(i / REQUESTS)
+            metrics.HTTP_REQUESTS_IN_PROGRESS.labels('GET').inc()
+            os._exit(0)
+        pids.append(pid)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    metrics.mark_process_dead(pids[0])
+
+    lines = set(metrics.collect().splitlines())
+    total = WORKERS * REQUESTS
+    route = 'method="GET",route="/api/v1/users/{username}"'
+    assert f'http_requests_total{{{route},status="200"}} {float(total)!r}' in lines
+    assert f'http_request_duration_seconds_count{{{route}}} {float(total)!r}' in lines
+    assert f'http_request_duration_seconds_bucket{{{route},le="+Inf"}} {float(total)!r}' in lines
+    assert f'http_request_duration_seconds_bucket{{{route},le="0.1"}} {float(WORKERS * 101)!r}' in lines
+    assert f'http_requests_in_progress{{method="GET"}} {float(WORKERS - 1)!r}' in lines, 'dead worker gauge'
+    print(f'multi-process merge: {WORKERS} workers ok')
+
+
+def main() -> None:
+    check_multiprocess()
+    counter = metrics.HTTP_REQUESTS.labels('GET', '/api/v1/users/{username}', 200)
+    histogram = metrics.HTTP_REQUEST_DURATION.labels('GET', '/api/v1/users/{username}')
+    bench('counter inc', counter.inc, number=100000, trace=False)
+    bench('histogram observe', lambda: histogram.observe(0.042), number=100000, trace=False)
+    bench('labels lookup + inc', lambda: metrics.HTTP_REQUESTS.labels('GET', '/', 200).inc(), number=100000)
+    bench(f'collect, {WORKERS} workers', metrics.collect, number=100)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Private memory per worker when the app is imported by each worker vs preloaded in the parent and forked, like gunicorn
+preload_app. Private memory is what a worker does not share with other processes, from /proc/<pid>/smaps_rollup
+
+Usage: python -m backend.benchmarks.preload_memory (Linux only)
+"""
+
+import gc
+import os
+import subprocess
+import sys
+import time
+
+WORKERS = 4
+
+
+def private_kib(pid: int) -> int:
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        return sum(int(line.split()[1]) for line in f if line.startswith(('Private_Clean', 'Private_Dirty')))
+
+
+def report(name: str, pids: list[int]) -> None:
+    private = [private_kib(pid) for pid in pids]
+    print(f'{name:<22} | {sum(private) / len(private) / 1024:,.1f}MiB private per worker')
+
+
+def imported_by_each_worker() -> None:
+    program = 'import backend.main, sys; print(flush=True); sys.stdin.read()'
+    workers = [
+        subprocess.Popen([sys.executable, '-c', program], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        for _ in range(WORKERS)
+    ]
+    for worker in workers:
+        worker.stdout.readline()
+    report('imported by each', [worker.pid for worker in workers])
+    for worker in workers:
+        worker.stdin.close()
+        worker.wait()
+
+
+def preloaded() -> None:
+    import backend.main  # noqa: F401
+
+    gc.freeze()
+    pids = []
+    for _ in range(WORKERS):
+        pid = os.fork()
+        if pid == 0:
+            # A worker that collects garbage once, like a worker serving requests would
+            gc.collect()
+            time.sleep(60)
+            os._exit(0)
+        pids.append(pid)
+    time.sleep(1)
+    report('preloaded and forked', pids)
+    for pid in pids:
+        os.kill(pid, 9)
+        os.waitpid(pid, 0)
+
+
+def main() -> None:
+    imported_by_each_worker()
+    preloaded()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Full entity vs column projection read model, per 100-row user page
+
+Usage: python -m backend.benchmarks.read_model
+"""
+
+from sqlalchemy import create_engine, desc, insert, select
+from sqlalchemy.orm import Session
+
+from backend.app.admin.crud.crud_user import user_dao
+from backend.app.admin.model import User
+from backend.app.admin.schema.user import GetUserInfoDetail
+from backend.benchmarks import bench
+from backend.utils.serializers import select_rows_mapping
+from backend.utils.timezone import timezone
+
+PAGE_SIZE = 100
+
+
+def main() -> None:
+    engine = create_engine('sqlite://')
+    User.__table__.create(engine)
+    with Session(engine) as session:
+        session.execute(
+            insert(User),
+            [
+                {
+                    'uuid': f'uuid-{i}',
+                    'username': f'user{i}',
+                    'password': '$2b$12$' + 'x' * 53,
+                    'salt': b's' * 29,
+                    'email': f'user{i}@example.com',
+                    'phone': '13800000000',
+                    'join_time': timezone.now(),
+                }
+                for i in range(PAGE_SIZE)
+            ],
+        )
+        session.commit()
+
+    def entity_page() -> list:
+        with Session(engine) as db:
+            users = db.scalars(select(User).order_by(desc(User.join_time)).limit(PAGE_SIZE)).all()
+            return [GetUserInfoDetail.model_validate(user) for user in users]
+
+    def read_model_page() -> list:
+        with Session(engine) as db:
+            stmt = select(*user_dao.detail_columns).order_by(desc(User.join_time)).limit(PAGE_SIZE)
+            rows = db.execute(stmt).all()
+            return [GetUserInfoDetail.model_validate(item) for item in select_rows_mapping(rows)]
+
+    print(f'{PAGE_SIZE} rows per page (sqlite in memory)')
+    bench('entity + from_attributes', entity_page, number=500)
+    bench('column projection + Row._mapping', read_model_page, number=500)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Response path of the user detail and a 100-row user page, pydantic response_model validation and serialization
+vs msgspec Structs encoded straight to bytes
+
+Usage: python -m backend.benchmarks.response_path
+"""
+
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from backend.app.admin.schema.user import GetUserInfoDetail, GetUserInfoDetailStruct
+from backend.benchmarks import bench, run_sync
+from backend.common.pagination import PageData, PageDataStruct, _LinksStruct
+from backend.common.response.response_schema import ResponseSchemaModel, response_base
+from backend.utils.timezone import timezone
+
+
+def _pydantic_response(field: Any, data: Any) -> JSONResponse:
+    # What FastAPI does for a route declaring a ResponseSchemaModel return type
+    content = run_sync(serialize_response(field=field, response_content=response_base.success(data=data)))
+    return JSONResponse(content)
+
+
+def main() -> None:
+    now = timezone.now().replace(tzinfo=None)
+    fields = GetUserInfoDetail.model_fields
+    rows = [
+        dict(zip(fields, (f'user{i}', f'user{i}@example.com', '13800000000', i, f'uuid-{i}', None, 1, False, now, now)))
+        for i in range(100)
+    ]
+    links = {'first': '/users?page=1&size=100', 'last': '/users?page=1&size=100', 'self': '/users?page=1&size=100'}
+    page = {'total': 100, 'page': 1, 'size': 100, 'total_pages': 1, 'links': {**links, 'next': None, 'prev': None}}
+
+    detail_field = create_response_field('detail', ResponseSchemaModel[GetUserInfoDetail])
+    page_field = create_response_field('page', ResponseSchemaModel[PageData[GetUserInfoDetail]])
+    detail_dict = rows[0]
+    page_dict = {'items': rows, **page}
+
+    def detail_struct() -> Any:
+        return response_base.fast_success(data=GetUserInfoDetailStruct.from_row(rows[0]))
+
+    def page_struct() -> Any:
+        items = [GetUserInfoDetailStruct.from_row(row) for row in rows]
+        data = PageDataStruct(items=items, **{**page, 'links': _LinksStruct(**page['links'])})
+        return response_base.fast_success(data=data)
+
+    assert _pydantic_response(detail_field, detail_dict).body == detail_struct().body
+    assert _pydantic_response(page_field, page_dict).body == page_struct().body
+
+    bench('user detail: pydantic response_model', lambda: _pydantic_response(detail_field, detail_dict), number=5000)
+    bench('user detail: msgspec Struct', detail_struct, number=5000)
+    bench('100-row page: pydantic response_model', lambda: _pydantic_response(page_field, page_dict), number=500)
+    bench('100-row page: msgspec Struct', page_struct, number=500)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Row serializers over a 10k-row user list, per-column getattr vs compiled per-class serializers
+
+Usage: python -m backend.benchmarks.serializers
+"""
+
+from decimal import Decimal
+from typing import Any
+
+from fastapi.encoders import decimal_encoder
+from sqlalchemy import create_engine, insert, inspect, select
+from sqlalchemy.orm import Session
+
+from backend.app.admin.crud.crud_user import user_dao
+from backend.app.admin.model import User
+from backend.benchmarks import bench
+from backend.utils.serializers import select_as_dict, select_list_serialize, select_rows_mapping
+from backend.utils.timezone import timezone
+
+ROWS = 10_000
+
+
+def _getattr_serialize(row: Any) -> dict[str, Any]:
+    # Previous select_columns_serialize
+    result = {}
+    for column in row.__table__.columns.keys():
+        value = getattr(row, column)
+        if isinstance(value, Decimal):
+            value = decimal_encoder(value)
+        result[column] = value
+    return result
+
+
+def main() -> None:
+    engine = create_engine('sqlite://')
+    User.__table__.create(engine)
+    with Session(engine, expire_on_commit=False) as session:
+        session.execute(
+            insert(User),
+            [
+                {
+                    'uuid': f'uuid-{i}',
+                    'username': f'user{i}',
+                    'password': '$2b$12$' + 'x' * 53,
+                    'salt': b's' * 29,
+                    'email': f'user{i}@example.com',
+                    'phone': '13800000000',
+                    'join_time': timezone.now(),
+                }
+                for i in range(ROWS)
+            ],
+        )
+        session.commit()
+        users = session.scalars(select(User)).all()
+        rows = session.execute(select(*user_dao.detail_columns)).all()
+
+        assert select_list_serialize(users) == [_getattr_serialize(user) for user in users]
+        session.expire(users[1])
+        assert select_list_serialize(users[1:2]) == [_getattr_serialize(users[1])], 'expired instance'
+        assert select_rows_mapping(rows) == [dict(row._mapping) for row in rows]
+        select_as_dict(users[0])
+        assert inspect(users[0]).session is session, 'select_as_dict detached the instance state'
+
+        print(f'{ROWS} rows')
+        bench('entities: getattr per column', lambda: [_getattr_serialize(user) for user in users], number=20)
+        bench('entities: compiled serializer', lambda: select_list_serialize(users), number=20)
+        bench('entities: select_as_dict(use_alias)', lambda: [select_as_dict(u, True) for u in users], number=20)
+        bench('rows: dict(Row._mapping)', lambda: [dict(row._mapping) for row in rows], number=20)
+        bench('rows: shared mapping keys', lambda: select_rows_mapping(rows), number=20)
+
+
+if __name__ == '__main__':
+    main()
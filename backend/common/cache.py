@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import hashlib
+import inspect
+import time
+
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Awaitable, Callable, Iterable, NamedTuple, Sequence
+
+from fastapi import Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.common.log import log
+from backend.core.conf import settings
+from backend.database.redis import get_redis_binary_client, invalidation_bus
+from backend.utils.serializers import MsgpackCodec
+
+TagsT = Iterable[str] | Callable[..., Iterable[str]]
+
+
+class CacheEntry(NamedTuple):
+    fresh_until: float
+    stale_until: float
+    # Versions of the entry's tags read before its value was loaded
+    versions: list[int]
+    value: Any
+
+
+class ResponseCache:
+    """
+    Two-tier cache, an in-process LRU (L1) in front of redis (L2)
+
+    Concurrent misses of the same key are coalesced into one load, and expired entries are served stale
+    while a single background load refreshes them. Redis values are msgpack encoded ``(fresh_until, stale_until,
+    versions, value)`` arrays, decoded by a typed codec
+
+    Entries carry the versions of their tags read before the value was loaded, and are only served while the tags
+    still have those versions. A value loaded by one worker while another worker invalidated its tags is stored
+    under the old versions, so it is never served after the invalidation, nor under the ETag of the new versions
+    """
+
+    default_codec: MsgpackCodec = MsgpackCodec(tuple[float, float, list[int], Any])
+
+    def __init__(self, prefix: str, max_size: int):
+        self.prefix = prefix
+        self.max_size = max_size
+        self._local: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._tag_keys: dict[str, set[str]] = {}
+        self._key_tags: dict[str, tuple[str, ...]] = {}
+        self._inflight: dict[tuple[str, tuple[int, ...]], asyncio.Task] = {}
+        self._tag_versions: dict[str, int] = {}
+        self._generation = 0
+
+    def _local_get(self, key: str) -> CacheEntry | None:
+        entry = self._local.get(key)
+        if entry is not None:
+            if entry.stale_until <= time.time():
+                self._local_drop(key)
+                return None
+            self._local.move_to_end(key)
+        return entry
+
+    def _local_set(self, key: str, entry: CacheEntry, tags: Iterable[str]) -> None:
+        self._local_drop(key)
+        self._local[key] = entry
+        self._key_tags[key] = tags = tuple(tags)
+        for tag in tags:
+            self._tag_keys.setdefault(tag, set()).add(key)
+        if len(self._local) > self.max_size:
+            self._local_drop(next(iter(self._local)))
+
+    def _local_drop(self, key: str) -> None:
+        # Keys leave the key sets of their tags with the entry, so the sets stay as small as the local cache
+        self._local.pop(key, None)
+        for tag in self._key_tags.pop(key, ()):
+            keys = self._tag_keys.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_keys[tag]
+
+    async def _remote_get(self, key: str, codec: MsgpackCodec) -> CacheEntry | None:
+        try:
+            data = await get_redis_binary_client().get(f'{self.prefix}:{key}')
+            return CacheEntry(*codec.decode(data)) if data else None
+        except Exception as e:
+            log.warning('Response cache read failed: {}', e)
+            return None
+
+    async def _remote_set(self, key: str, entry: CacheEntry, tags: Iterable[str], codec: MsgpackCodec) -> None:
+        expire = max(int(entry.stale_until - time.time()), 1)
+        try:
+            async with get_redis_binary_client().pipeline(transaction=False) as pipe:
+                pipe.set(f'{self.prefix}:{key}', codec.encode(entry), ex=expire)
+                for tag in tags:
+                    pipe.sadd(f'{self.prefix}:tag:{tag}', key)
+                    pipe.expire(f'{self.prefix}:tag:{tag}', expire)
+                await pipe.execute()
+        except Exception as e:
+            log.warning('Response cache write failed: {}', e)
+
+    async def _load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: int,
+        stale_ttl: int,
+        tags: Sequence[str],
+        versions: list[int],
+        codec: MsgpackCodec,
+    ) -> Any:
+        generation = self._generation
+        value = await loader()
+        # Skip storing a value loaded across an invalidation of this worker, it may already be outdated. Invalidations
+        # by other workers are caught by the versions of the entry
+        if generation == self._generation:
+            now = time.time()
+            entry = CacheEntry(now + ttl, now + ttl + stale_ttl, versions, value)
+            self._local_set(key, entry, tags)
+            await self._remote_set(key, entry, tags, codec)
+        return value
+
+    def _single_flight(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: int,
+        stale_ttl: int,
+        tags: Sequence[str],
+        versions: list[int],
+        codec: MsgpackCodec,
+    ) -> asyncio.Task:
+        # Only loads started with the same tag versions are shared, a load started before an invalidation may
+        # return the outdated value
+        inflight_key = (key, tuple(versions))
+        task = self._inflight.get(inflight_key)
+        if task is None:
+            # The load runs in its own task, so a cancelled caller does not cancel the other waiters
+            task = asyncio.create_task(self._load(key, loader, ttl, stale_ttl, tags, versions, codec))
+            self._inflight[inflight_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(inflight_key, None))
+        return task
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        *,
+        ttl: int,
+        stale_ttl: int,
+        tags: Iterable[str] = (),
+        codec: MsgpackCodec | None = None,
+    ) -> Any:
+        """
+        Get cached value, or load and cache it
+
+        :param key: Cache key
+        :param loader: Coroutine function that loads the value on miss
+        :param ttl: Fresh time, in seconds
+        :param stale_ttl: Stale-while-revalidate time after expiration, in seconds
+        :param tags: Invalidation tags
+        :param codec: Redis value codec of ``(fresh_until, stale_until, versions, value)``
+        :return:
+        """
+        codec = codec or self.default_codec
+        tags = list(tags)
+        versions = await self.tag_versions(tags)
+        if versions is None:
+            # Without redis, invalidations of other workers are not seen
+            return await loader()
+        entry = self._local_get(key)
+        if entry is None or entry.versions != versions:
+            entry = await self._remote_get(key, codec)
+            if entry is not None and entry.versions == versions:
+                self._local_set(key, entry, tags)
+            else:
+                entry = None
+        if entry is not None:
+            now = time.time()
+            if now < entry.fresh_until:
+                return entry.value
+            if now < entry.stale_until:
+                if (key, tuple(versions)) not in self._inflight:
+                    task = self._single_flight(key, loader, ttl, stale_ttl, tags, versions, codec)
+                    task.add_done_callback(_log_refresh_error)
+                return entry.value
+        return await asyncio.shield(self._single_flight(key, loader, ttl, stale_ttl, tags, versions, codec))
+
+    async def tag_versions(self, tags: Sequence[str]) -> list[int] | None:
+        """
+        Get the versions of the tags, bumped by every invalidation of the tag
+
+        Versions are kept in process until their tag is invalidated, so known versions cost no redis round trip
+
+        :param tags:
+        :return: ``None`` if redis is unavailable
+        """
+        versions = {tag: self._tag_versions[tag] for tag in tags if tag in self._tag_versions}
+        missing = [tag for tag in tags if tag not in versions]
+        if missing:
+            generation = self._generation
+            keys = [f'{self.prefix}:version:{tag}' for tag in missing]
+            try:
+                redis_client = get_redis_binary_client()
+                values = await redis_client.mget_nonatomic(keys)
+                if None in values:
+                    # Versions start from the current time, so a lost counter never repeats an issued version
+                    async with redis_client.pipeline(transaction=False) as pipe:
+                        for key, value in zip(keys, values):
+                            if value is None:
+                                pipe.set(key, time.time_ns(), nx=True)
+                        await pipe.execute()
+                    values = await redis_client.mget_nonatomic(keys)
+            except Exception as e:
+                log.warning('Response cache version read failed: {}', e)
+                return None
+            fetched = dict(zip(missing, map(int, values)))
+            versions.update(fetched)
+            # Skip storing versions read across an invalidation, they may already be outdated
+            if generation == self._generation:
+                self._tag_versions.update(fetched)
+                while len(self._tag_versions) > self.max_size:
+                    del self._tag_versions[next(iter(self._tag_versions))]
+        return [versions[tag] for tag in tags]
+
+    def invalidate_local(self, *tags: str) -> None:
+        """
+        Drop in-process entries of the tags
+
+        :param tags:
+        :return:
+        """
+        self._generation += 1
+        for tag in tags:
+            self._tag_versions.pop(tag, None)
+            for key in tuple(self._tag_keys.get(tag, ())):
+                self._local_drop(key)
+
+    async def invalidate_tags(self, *tags: str) -> None:
+        """
+        Drop all entries of the tags, in redis and in the local cache of every worker
+
+        :param tags:
+        :return:
+        """
+        self.invalidate_local(*tags)
+        try:
+            redis_client = get_redis_binary_client()
+            for tag in tags:
+                tag_key = f'{self.prefix}:tag:{tag}'
+                keys = await redis_client.smembers(tag_key)
+                await redis_client.unlink(tag_key, *(f'{self.prefix}:{key.decode()}' for key in keys))
+                await redis_client.incr(f'{self.prefix}:version:{tag}')
+        except Exception as e:
+            log.warning('Response cache invalidation failed: {}', e)
+        await invalidation_bus.publish(*tags)
+
+    def clear_local(self) -> None:
+        self._generation += 1
+        self._local.clear()
+        self._tag_keys.clear()
+        self._key_tags.clear()
+        self._tag_versions.clear()
+
+    def on_invalidate(self, tags: list[str] | None) -> None:
+        """
+        Invalidation bus handler
+
+        :param tags: Invalidated tags, ``None`` means messages were missed and everything is dropped
+        :return:
+        """
+        if tags is None:
+            self.clear_local()
+        else:
+            self.invalidate_local(*tags)
+
+
+def _log_refresh_error(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        log.warning('Response cache background refresh failed: {}', task.exception())
+
+
+def default_key_builder(func: Callable, arguments: dict[str, Any]) -> str:
+    """
+    Build cache key from the call arguments
+
+    Path and query of a ``Request`` argument, plain values and the ``id`` of principal objects take part in the
+    key, sessions and other objects do not
+
+    :param func:
+    :param arguments:
+    :return:
+    """
+    parts = []
+    for name, value in sorted(arguments.items()):
+        if isinstance(value, AsyncSession):
+            continue
+        if isinstance(value, Request):
+            parts.append(f'{name}={value.url.path}?{value.url.query}')
+        elif value is None or isinstance(value, (str, int, float, bool)):
+            parts.append(f'{name}={value}')
+        elif hasattr(value, 'id'):
+            parts.append(f'{name}.id={value.id}')
+    digest = hashlib.blake2b('&'.join(parts).encode(), digest_size=16).hexdigest()
+    return f'{func.__module__}.{func.__qualname__}:{digest}'
+
+
+def _tags_resolver(tags: TagsT) -> Callable[[dict[str, Any]], Iterable[str]]:
+    """
+    Build the function resolving the tags of a call, tag functions get the bound arguments they declare
+
+    :param tags:
+    :return:
+    """
+    if not callable(tags):
+        return lambda arguments: tags
+    parameters = inspect.signature(tags).parameters
+    if any(parameter.kind is inspect.Parameter.VAR_KEYWORD for parameter in parameters.values()):
+        return lambda arguments: tags(**arguments)
+    return lambda arguments: tags(**{name: arguments[name] for name in parameters if name in arguments})
+
+
+def cached(
+    ttl: int = settings.CACHE_TTL,
+    *,
+    stale_ttl: int = settings.CACHE_STALE_TTL,
+    tags: TagsT = (),
+    key_builder: Callable[[Callable, dict[str, Any]], str] = default_key_builder,
+    schema: Any = Any,
+):
+    """
+    Cache the result of an async route or service function
+
+    The function runs in a task of its own, shared by coalesced callers and kept running by stale-while-revalidate
+    refreshes after the request that started it has ended, so it must not take request scoped resources like the
+    request's database session, it opens its own
+
+    E.g. ::
+
+        @cached(tags=lambda username: [f'user:{username}'])
+        async def get_userinfo(*, username: str) -> dict: ...
+
+    :param ttl: Fresh time, in seconds
+    :param stale_ttl: Stale-while-revalidate time after expiration, in seconds
+    :param tags: Invalidation tags, or a function called with the bound arguments that returns them
+    :param key_builder: Function building the cache key from the function and its bound arguments
+    :param schema: Result type, e.g. a ``msgspec.Struct``, redis values are decoded straight into it
+    :return:
+    """
+
+    resolve_tags = _tags_resolver(tags)
+
+    def decorator(func: Callable[..., Awaitable[Any]]):
+        signature = inspect.signature(func)
+        codec = MsgpackCodec(tuple[float, float, list[int], schema])
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            arguments = signature.bind(*args, **kwargs).arguments
+            key = key_builder(func, arguments)
+            return await response_cache.get_or_load(
+                key,
+                lambda: func(*args, **kwargs),
+                ttl=ttl,
+                stale_ttl=stale_ttl,
+                tags=resolve_tags(arguments),
+                codec=codec,
+            )
+
+        return wrapper
+
+    return decorator
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # Weak comparison, opaque tags are compared without their W/ prefix
+    if if_none_match.strip() == '*':
+        return True
+    opaque_tag = etag.removeprefix('W/')
+    return any(item.strip().removeprefix('W/') == opaque_tag for item in if_none_match.split(','))
+
+
+def etag(*, tags: TagsT):
+    """
+    Weak ETag and conditional GET of a route returning a ``Response``, versioned by response cache tags
+
+    The ETag is built from the request path, query and the tag versions, no body is hashed. A matching
+    ``If-None-Match`` is answered with 304 before the route runs, so the response must only depend on the path,
+    query and the tagged data, and every write of the data must invalidate its tags. The body must be read after the
+    versions, from the database or through ``cached`` with the same tags, whose entries are only served while their
+    versions are current
+
+    E.g. ::
+
+        @router.get('/{username}')
+        @etag(tags=lambda username: [f'user:{username}'])
+        async def get_user(request: Request, username: str) -> Response: ...
+
+    :param tags: Version tags, or a function called with the bound arguments it declares that returns them
+    :return:
+    """
+    resolve_tags = _tags_resolver(tags)
+
+    def decorator(func: Callable[..., Awaitable[Any]]):
+        signature = inspect.signature(func)
+        request_name = next(
+            (name for name, parameter in signature.parameters.items() if parameter.annotation is Request), None
+        )
+        if request_name is None:
+            raise TypeError(f'{func.__qualname__} requires a Request parameter to use etag')
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            arguments = signature.bind(*args, **kwargs).arguments
+            versions = await response_cache.tag_versions(list(resolve_tags(arguments)))
+            if versions is None:
+                return await func(*args, **kwargs)
+            request: Request = arguments[request_name]
+            source = f'{request.url.path}?{request.url.query}|{versions}'
+            value = f'W/"{hashlib.blake2b(source.encode(), digest_size=12).hexdigest()}"'
+            headers = {'etag': value, 'cache-control': 'private, no-cache'}
+            if_none_match = request.headers.get('if-none-match')
+            if if_none_match and _etag_matches(if_none_match, value):
+                return Response(status_code=304, headers=headers)
+            response = await func(*args, **kwargs)
+            if isinstance(response, Response) and response.status_code == 200:
+                response.headers.update(headers)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+# Response cache singleton
+response_cache: ResponseCache = ResponseCache(settings.CACHE_REDIS_PREFIX, settings.CACHE_LOCAL_MAX_SIZE)
+invalidation_bus.add_handler(response_cache.on_invalidate)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+
+from collections import deque
+from enum import IntEnum
+
+from backend.common.metrics import (
+    CONCURRENCY_IN_FLIGHT,
+    CONCURRENCY_LIMIT,
+    CONCURRENCY_QUEUE_SIZE,
+    CONCURRENCY_QUEUE_WAIT,
+    CONCURRENCY_REJECTED,
+)
+from backend.core.conf import settings
+
+# Baselines below this are treated as this, so that sub-millisecond jitter does not count as latency inflation
+_MIN_BASELINE = 0.005
+
+
+class Priority(IntEnum):
+    HIGH = 0
+    NORMAL = 1
+
+
+class Rejected(Exception):
+    """The limiter did not admit a request"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdaptiveLimiter:
+    """
+    Adaptive concurrency limit of a worker, AIMD on latency inflation
+
+    Each route keeps its no-load latency baseline, the minimum latency seen in the last ``baseline_window`` seconds.
+    A request slower than ``tolerance`` times its route's baseline means work is queueing inside the worker, and the
+    limit shrinks by ``backoff``; otherwise, when the limit was actually in use, it grows by one.
+
+    Requests beyond the limit wait in a bounded queue, high priority ones first. When the queue is full, a high
+    priority request evicts the newest normal priority waiter, a normal priority request is rejected
+    """
+
+    def __init__(
+        self,
+        *,
+        initial_limit: int = settings.CONCURRENCY_INITIAL_LIMIT,
+        min_limit: int = settings.CONCURRENCY_MIN_LIMIT,
+        max_limit: int = settings.CONCURRENCY_MAX_LIMIT,
+        tolerance: float = settings.CONCURRENCY_LATENCY_TOLERANCE,
+        backoff: float = settings.CONCURRENCY_BACKOFF_RATIO,
+        queue_size: int = settings.CONCURRENCY_QUEUE_SIZE,
+        baseline_window: float = settings.CONCURRENCY_BASELINE_WINDOW,
+    ) -> None:
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.queue_size = queue_size
+        self.baseline_window = baseline_window
+        self.in_flight = 0
+        self._queues: tuple[deque[asyncio.Future], deque[asyncio.Future]] = (deque(), deque())
+        # Route -> (minimum latency, window start time)
+        self._baselines: dict[str, tuple[float, float]] = {}
+        self._limit_gauge = CONCURRENCY_LIMIT.labels()
+        self._in_flight_gauge = CONCURRENCY_IN_FLIGHT.labels()
+
+    @property
+    def queued(self) -> int:
+        return len(self._queues[Priority.HIGH]) + len(self._queues[Priority.NORMAL])
+
+    async def acquire(self, priority: Priority, timeout: float) -> None:
+        """
+        Take a slot, waiting in the queue for at most ``timeout`` seconds
+
+        :param priority:
+        :param timeout:
+        :return:
+        """
+        if self.in_flight < self.limit and not self.queued:
+            self._take()
+            return
+        if self.queued >= self.queue_size:
+            normal_queue = self._queues[Priority.NORMAL]
+            if priority is Priority.NORMAL or not normal_queue:
+                self._reject(priority, 'queue_full')
+            # The evicted waiter raises Rejected in its own acquire
+            evicted = normal_queue.pop()
+            if not evicted.done():
+                evicted.set_result(False)
+
+        queue = self._queues[priority]
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        CONCURRENCY_QUEUE_SIZE.labels(priority.name.lower()).inc()
+        start_time = time.perf_counter()
+        try:
+            granted = await asyncio.wait_for(waiter, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled() and waiter.result():
+                # Granted while being cancelled, hand the slot on
+                self._put()
+            elif waiter in queue:
+                queue.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject(priority, 'timeout')
+            raise
+        finally:
+            CONCURRENCY_QUEUE_SIZE.labels(priority.name.lower()).dec()
+            CONCURRENCY_QUEUE_WAIT.labels(priority.name.lower()).observe(time.perf_counter() - start_time)
+        if not granted:
+            self._reject(priority, 'evicted')
+
+    def release(self, route: str | None, latency: float) -> None:
+        """
+        Return a slot and adjust the limit by the latency of the request
+
+        :param route: Route template, None skips the limit adjustment
+        :param latency: Time the request held the slot, in seconds
+        :return:
+        """
+        in_flight = self.in_flight
+        if route is not None:
+            self._update_limit(route, latency, in_flight)
+        self._put()
+
+    def _update_limit(self, route: str, latency: float, in_flight: int) -> None:
+        now = time.monotonic()
+        entry = self._baselines.get(route)
+        if entry is None or now - entry[1] > self.baseline_window:
+            baseline, window_start = latency, now
+        else:
+            baseline, window_start = min(entry[0], latency), entry[1]
+        self._baselines[route] = (baseline, window_start)
+        if latency > max(baseline, _MIN_BASELINE) * self.tolerance:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+        elif in_flight * 2 >= self.limit:
+            self.limit = min(self.max_limit, self.limit + 1)
+        else:
+            return
+        self._limit_gauge.set(self.limit)
+
+    def _take(self) -> None:
+        self.in_flight += 1
+        self._in_flight_gauge.inc()
+
+    def _put(self) -> None:
+        self.in_flight -= 1
+        self._in_flight_gauge.dec()
+        # Hand free slots to the waiters, high priority first
+        while self.in_flight < self.limit and self.queued:
+            queue = self._queues[Priority.HIGH] or self._queues[Priority.NORMAL]
+            waiter = queue.popleft()
+            if waiter.done():
+                continue
+            self._take()
+            waiter.set_result(True)
+
+    @staticmethod
+    def _reject(priority: Priority, reason: str) -> None:
+        CONCURRENCY_REJECTED.labels(priority.name.lower(), reason).inc()
+        raise Rejected(reason)
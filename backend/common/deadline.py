@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import math
+import re
+import time
+
+from contextvars import ContextVar, Token
+from typing import Any
+
+from fastapi import Depends
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from backend.common.exception.errors import DeadlineExceededError
+from backend.common.metrics import DEADLINE_EXCEEDED
+
+# MySQL error of a statement interrupted by MAX_EXECUTION_TIME
+_ER_QUERY_TIMEOUT = 3024
+
+_SELECT = re.compile(r'\s*SELECT\b', re.IGNORECASE)
+
+
+class RequestDeadline:
+    """Absolute deadline of a request, in time.monotonic() time"""
+
+    __slots__ = ('expires_at',)
+
+    def __init__(self, timeout: float) -> None:
+        self.expires_at = time.monotonic() + timeout
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def narrow(self, timeout: float) -> None:
+        self.expires_at = min(self.expires_at, time.monotonic() + timeout)
+
+
+_request_deadline: ContextVar[RequestDeadline | None] = ContextVar('request_deadline', default=None)
+
+
+def start_deadline(timeout: float) -> tuple[RequestDeadline, Token]:
+    """
+    Set the deadline of the current request
+
+    :param timeout: In seconds
+    :return: Deadline and the token to reset the context with
+    """
+    deadline = RequestDeadline(timeout)
+    return deadline, _request_deadline.set(deadline)
+
+
+def reset_deadline(token: Token) -> None:
+    _request_deadline.reset(token)
+
+
+def current_deadline() -> RequestDeadline | None:
+    return _request_deadline.get()
+
+
+def request_timeout(seconds: float) -> Any:
+    """
+    Route dependency that shortens the request deadline, e.g. ``dependencies=[request_timeout(5)]``
+
+    :param seconds:
+    :return:
+    """
+
+    async def narrow_deadline() -> None:
+        deadline = _request_deadline.get()
+        if deadline is not None:
+            deadline.narrow(seconds)
+
+    return Depends(narrow_deadline)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    Apply the request deadline to the statements of an engine
+
+    Statements are not started past the deadline. On MySQL, SELECT statements carry a ``MAX_EXECUTION_TIME`` hint of
+    the remaining time, so the server stops them even when nobody waits for the result anymore; MySQL offers no
+    per-statement timeout for other statements
+
+    :param engine:
+    :return:
+    """
+    sync_engine = engine.sync_engine
+    hint_selects = sync_engine.dialect.name == 'mysql'
+
+    @event.listens_for(sync_engine, 'before_cursor_execute', retval=True)
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        deadline = _request_deadline.get()
+        if deadline is None:
+            return statement, parameters
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            DEADLINE_EXCEEDED.labels('before_execute').inc()
+            raise DeadlineExceededError
+        if hint_selects:
+            match = _SELECT.match(statement)
+            if match is not None:
+                hint = f' /*+ MAX_EXECUTION_TIME({math.ceil(remaining * 1000)}) */'
+                statement = statement[: match.end()] + hint + statement[match.end() :]
+        return statement, parameters
+
+    @event.listens_for(sync_engine, 'handle_error')
+    def handle_error(context):
+        original_exception = context.original_exception
+        if getattr(original_exception, 'args', None) and original_exception.args[0] == _ER_QUERY_TIMEOUT:
+            DEADLINE_EXCEEDED.labels('mysql').inc()
+            raise DeadlineExceededError from original_exception
@@ -82,6 +82,17 @@ class GatewayError(BaseExceptionMixin):
         super().__init__(msg=msg, data=data, background=background)
 
 
+class DeadlineExceededError(BaseExceptionMixin):
+    """Request Deadline Exception"""
+
+    code = StandardResponseCode.HTTP_504
+
+    def __init__(
+        self, *, msg: str = 'Request deadline exceeded', data: Any = None, background: BackgroundTask | None = None
+    ):
+        super().__init__(msg=msg, data=data, background=background)
+
+
 class AuthorizationError(BaseExceptionMixin):
     """Authorization Exception"""
 
@@ -4,6 +4,9 @@ import inspect
 import logging
 import os
 import sys
+import tarfile
+
+from concurrent.futures import ThreadPoolExecutor
 
 from loguru import logger
 
@@ -11,29 +14,79 @@ from backend.core import path_conf
 from backend.core.conf import settings
 
 
+# Extra of the structured access log records, which only go to their own file
+ACCESS_JSON = 'access_json'
+
+
+def is_plain_record(record: dict) -> bool:
+    """
+    Loguru filter of the records for the console and the text log files
+
+    :param record:
+    :return:
+    """
+    return 'log_file' not in record['extra']
+
+
 class InterceptHandler(logging.Handler):
     """
     Log interception handler, used to redirect standard library logs to loguru.
 
+    Loguru levels are looked up once per level name, and the stack depth of the caller once per call site, so
+    records of noisy loggers like SQLAlchemy echo do not walk the stack each time. Records below the handler level
+    are dropped by the standard library before they are formatted.
+
     Reference: https://loguru.readthedocs.io/en/stable/overview.html#entirely-compatible-with-standard-logging
     """
 
+    def __init__(self, level: int | str = logging.NOTSET):
+        super().__init__(level)
+        self._levels: dict[str, str | int] = {}
+        self._depths: dict[tuple[str, int], int] = {}
+
     def emit(self, record: logging.LogRecord):
         # Get the corresponding Loguru level (if it exists)
-        try:
-            level = logger.level(record.levelname).name
-        except ValueError:
-            level = record.levelno
-
-        # Find the caller that logged the message
-        frame, depth = inspect.currentframe(), 0
-        while frame and (depth == 0 or frame.f_code.co_filename == logging.__file__):
-            frame = frame.f_back
-            depth += 1
+        level = self._levels.get(record.levelname)
+        if level is None:
+            try:
+                level = logger.level(record.levelname).name
+            except ValueError:
+                level = record.levelno
+            self._levels[record.levelname] = level
+
+        # Find the caller that logged the message, the depth is the same on every call from a call site
+        call_site = (record.pathname, record.lineno)
+        depth = self._depths.get(call_site)
+        if depth is None:
+            frame, depth = inspect.currentframe(), 0
+            while frame and (depth == 0 or frame.f_code.co_filename == logging.__file__):
+                frame = frame.f_back
+                depth += 1
+            self._depths[call_site] = depth
 
         logger.opt(depth=depth, exception=record.exc_info).log(level, record.getMessage())
 
 
+# Rotated log files are compressed here, so that the logging thread is not blocked during compression
+_compression_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='log-compression')
+
+
+def _compress(path: str) -> None:
+    with tarfile.open(f'{path}.tar.gz', 'w:gz') as f:
+        f.add(path, os.path.basename(path))
+    os.remove(path)
+
+
+def compress_in_background(path: str) -> None:
+    """
+    Loguru compression function that compresses a rotated log file to tar.gz in a background thread
+
+    :param path: Rotated log file
+    :return:
+    """
+    _compression_executor.submit(_compress, path)
+
+
 def setup_logging() -> None:
     """
     Set up log handlers.
@@ -42,8 +95,12 @@ def setup_logging() -> None:
     - https://github.com/benoitc/gunicorn/issues/1572#issuecomment-638391953
     - https://github.com/pawamoy/pawamoy.github.io/issues/17
     """
-    # Set root log handler and level
-    logging.root.handlers = [InterceptHandler()]
+    # Set root log handler and level, records below the lowest loguru sink level are never formatted
+    min_level = min(
+        logger.level(level).no
+        for level in (settings.LOG_STD_LEVEL, settings.LOG_ACCESS_FILE_LEVEL, settings.LOG_ERROR_FILE_LEVEL)
+    )
+    logging.root.handlers = [InterceptHandler(min_level)]
     logging.root.setLevel(settings.LOG_STD_LEVEL)
 
     # Configure log propagation rules
@@ -65,11 +122,25 @@ def setup_logging() -> None:
                 'sink': sys.stdout,
                 'level': settings.LOG_STD_LEVEL,
                 'format': settings.LOG_STD_FORMAT,
+                'filter': is_plain_record,
             }
         ]
     )
 
 
+def file_sink_config() -> dict:
+    """
+    Rotation, retention and compression of the log files
+
+    :return: Keyword arguments of ``logger.add``
+    """
+    return {
+        'rotation': '5 MB',
+        'retention': '7 days',
+        'compression': compress_in_background,
+    }
+
+
 def set_custom_logfile():
     """Set custom log files."""
     log_path = path_conf.LOG_DIR
@@ -85,16 +156,14 @@ def set_custom_logfile():
     log_config = {
         'format': settings.LOG_FILE_FORMAT,
         'enqueue': True,
-        'rotation': '5 MB',
-        'retention': '7 days',
-        'compression': 'tar.gz',
+        **file_sink_config(),
     }
 
     # Standard output file
     logger.add(
         str(log_access_file),
         level=settings.LOG_ACCESS_FILE_LEVEL,
-        filter=lambda record: record['level'].no <= 25,
+        filter=lambda record: record['level'].no <= 25 and is_plain_record(record),
         backtrace=False,
         diagnose=False,
         **log_config,
@@ -110,5 +179,16 @@ def set_custom_logfile():
         **log_config,
     )
 
+    # Structured access log file, lines are formatted by the access middleware
+    if settings.MIDDLEWARE_ACCESS_FORMAT == 'json':
+        logger.add(
+            os.path.join(log_path, settings.LOG_ACCESS_JSON_FILENAME),
+            level=settings.LOG_ACCESS_FILE_LEVEL,
+            format='{message}',
+            filter=lambda record: record['extra'].get('log_file') == ACCESS_JSON,
+            enqueue=True,
+            **file_sink_config(),
+        )
+
 
 log = logger
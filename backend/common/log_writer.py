@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Log writer process shared by the workers of a gunicorn server
+
+Every worker writing and rotating the same log files races: two workers rotate the same file at once, lines written
+to a file another worker just renamed are lost, and each worker compresses on its own. With settings.LOG_WRITER the
+workers send their formatted file log lines in batches over a unix socket to one writer process, the only one that
+opens, rotates and compresses the files. Workers that cannot reach the writer append their lines to the file
+directly, without rotation, so no line is lost while the writer starts or restarts
+"""
+
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import struct
+import threading
+import weakref
+
+from collections import deque
+
+import msgspec
+
+from loguru import logger
+
+from backend.common.log import ACCESS_JSON, file_sink_config, is_plain_record
+from backend.core import path_conf
+from backend.core.conf import settings
+
+# Frames are a 4 byte big endian length and a msgpack list of [file, text] pairs
+_HEADER = struct.Struct('>I')
+
+_encoder = msgspec.msgpack.Encoder()
+_decoder = msgspec.msgpack.Decoder(list[tuple[str, str]])
+
+
+def log_files() -> dict[str, str]:
+    """
+    Log files by the name the workers send them under
+
+    :return:
+    """
+    return {
+        'access': os.path.join(path_conf.LOG_DIR, settings.LOG_ACCESS_FILENAME),
+        'error': os.path.join(path_conf.LOG_DIR, settings.LOG_ERROR_FILENAME),
+        ACCESS_JSON: os.path.join(path_conf.LOG_DIR, settings.LOG_ACCESS_JSON_FILENAME),
+    }
+
+
+class LogWriterClient:
+    """
+    Worker side of the log writer, a loguru sink per log file
+
+    Lines are buffered in memory and sent by a background thread once ``batch_size`` lines are waiting or every
+    ``flush_interval`` seconds, so a log call never waits for the socket. The thread and the connection belong to the
+    process that started them and are created again after a fork, with a new lock, since the thread of the parent may
+    hold it at the fork
+    """
+
+    def __init__(
+        self,
+        path: str = str(path_conf.LOG_WRITER_SOCKET),
+        batch_size: int = settings.LOG_WRITER_BATCH_SIZE,
+        flush_interval: float = settings.LOG_WRITER_FLUSH_INTERVAL,
+    ) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._files = log_files()
+        self._buffer: deque[tuple[str, str]] = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._socket: socket.socket | None = None
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        _clients.add(self)
+
+    def sink(self, file: str) -> 'LogWriterSink':
+        """
+        Loguru sink that sends the lines of a log file to the writer
+
+        :param file: Name of the file in ``log_files()``
+        :return:
+        """
+        return LogWriterSink(self, file)
+
+    def write(self, file: str, text: str) -> None:
+        if self._pid != os.getpid():
+            self._start()
+        self._buffer.append((file, text))
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self) -> None:
+        """
+        Send all buffered lines
+
+        :return:
+        """
+        with self._lock:
+            while self._buffer:
+                batch = []
+                while self._buffer and len(batch) < self.batch_size:
+                    batch.append(self._buffer.popleft())
+                self._send(batch)
+
+    def _reset_after_fork(self) -> None:
+        # A forked child inherits the lines of its parent, which the parent sends itself
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._socket = None
+        self._thread = None
+        self._pid = None
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='log-writer-client', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _send(self, batch: list[tuple[str, str]]) -> None:
+        payload = _encoder.encode(batch)
+        try:
+            if self._socket is None:
+                self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self._socket.connect(self.path)
+            self._socket.sendall(_HEADER.pack(len(payload)) + payload)
+        except OSError:
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+            self._append(batch)
+
+    def _append(self, batch: list[tuple[str, str]]) -> None:
+        texts: dict[str, list[str]] = {}
+        for file, text in batch:
+            texts.setdefault(file, []).append(text)
+        for file, lines in texts.items():
+            with open(self._files[file], 'a', encoding='utf8') as f:
+                f.write(''.join(lines))
+
+
+_clients: weakref.WeakSet[LogWriterClient] = weakref.WeakSet()
+
+
+def _reset_clients_after_fork() -> None:
+    for client in _clients:
+        client._reset_after_fork()
+
+
+os.register_at_fork(after_in_child=_reset_clients_after_fork)
+
+
+class LogWriterSink:
+    """Loguru sink of one log file, stopped with the loguru handler, which sends the lines still buffered"""
+
+    def __init__(self, client: LogWriterClient, file: str) -> None:
+        self.client = client
+        self.file = file
+
+    def write(self, message: str) -> None:
+        self.client.write(self.file, str(message))
+
+    def stop(self) -> None:
+        self.client.flush()
+
+
+def set_writer_logfile() -> None:
+    """Send the file log lines to the log writer process, in place of ``set_custom_logfile``"""
+    client = LogWriterClient()
+    logger.add(
+        client.sink('access'),
+        level=settings.LOG_ACCESS_FILE_LEVEL,
+        format=settings.LOG_FILE_FORMAT,
+        filter=lambda record: record['level'].no <= 25 and is_plain_record(record),
+        backtrace=False,
+        diagnose=False,
+    )
+    logger.add(
+        client.sink('error'),
+        level=settings.LOG_ERROR_FILE_LEVEL,
+        format=settings.LOG_FILE_FORMAT,
+        filter=lambda record: record['level'].no >= 30,
+        backtrace=True,
+        diagnose=True,
+    )
+    if settings.MIDDLEWARE_ACCESS_FORMAT == 'json':
+        logger.add(
+            client.sink(ACCESS_JSON),
+            level=settings.LOG_ACCESS_FILE_LEVEL,
+            format='{message}',
+            filter=lambda record: record['extra'].get('log_file') == ACCESS_JSON,
+        )
+
+
+async def _serve(path: str) -> None:
+    files = log_files()
+    # The same rotation, retention and compression as the log files of a single process
+    for file, log_file in files.items():
+        logger.add(
+            log_file,
+            level=0,
+            format='{message}',
+            filter=lambda record, file=file: record['extra'].get('log_file') == file,
+            delay=True,
+            **file_sink_config(),
+        )
+    loggers = {file: logger.bind(log_file=file).opt(raw=True) for file in files}
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+                batch = _decoder.decode(await reader.readexactly(size))
+                texts: dict[str, list[str]] = {}
+                for file, text in batch:
+                    texts.setdefault(file, []).append(text)
+                for file, lines in texts.items():
+                    if file in loggers:
+                        loggers[file].info(''.join(lines))
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    if os.path.exists(path):
+        os.remove(path)
+    server = await asyncio.start_unix_server(handle, path)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    async with server:
+        await stop.wait()
+    os.remove(path)
+
+
+def run_writer(path: str = str(path_conf.LOG_WRITER_SOCKET)) -> None:
+    """
+    Run the log writer until SIGTERM or SIGINT
+
+    :param path: Unix socket path
+    :return:
+    """
+    logger.remove()
+    os.makedirs(path_conf.LOG_DIR, exist_ok=True)
+    try:
+        asyncio.run(_serve(path))
+    finally:
+        # Closes the files, compression of the last rotated file finishes before the process exits
+        logger.remove()
+
+
+def start_writer() -> multiprocessing.Process:
+    """
+    Start the log writer process, before the workers start
+
+    :return:
+    """
+    process = multiprocessing.get_context('spawn').Process(target=run_writer, name='log-writer')
+    process.start()
+    return process
+
+
+def stop_writer(process: multiprocessing.Process, timeout: float = 10) -> None:
+    """
+    Stop the log writer process, after the workers exited
+
+    :param process:
+    :param timeout: In seconds, the process is killed after it
+    :return:
+    """
+    process.terminate()
+    process.join(timeout)
+    if process.is_alive():
+        process.kill()
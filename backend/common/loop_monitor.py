@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import sys
+import threading
+import time
+import traceback
+
+from backend.common.log import log
+from backend.common.metrics import EVENT_LOOP_BLOCKED, EVENT_LOOP_LAG
+from backend.core.conf import settings
+
+
+class LoopMonitor:
+    """
+    Event loop lag and blocking callback detector
+
+    A probe task sleeps ``interval`` seconds in a loop and records how late it wakes up as the scheduling lag. A
+    watchdog thread checks the probe's wake-up deadline; once it is overdue by ``slow_callback`` seconds, a callback is
+    blocking the loop right now, and the stack of the event loop thread shows which one. Stacks are logged at most
+    once per ``log_interval`` seconds, blocked episodes are always counted, by the event loop thread since only that
+    thread writes metric values
+    """
+
+    def __init__(
+        self,
+        *,
+        interval: float = settings.LOOP_MONITOR_INTERVAL,
+        slow_callback: float = settings.LOOP_MONITOR_SLOW_CALLBACK,
+        log_interval: float = settings.LOOP_MONITOR_LOG_INTERVAL,
+    ) -> None:
+        self.interval = interval
+        self.slow_callback = slow_callback
+        self.log_interval = log_interval
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread_id = 0
+        self._task: asyncio.Task | None = None
+        self._blocked = None
+        self._watchdog: threading.Thread | None = None
+        self._stopped = threading.Event()
+        # Wake-up deadline of the probe, in time.monotonic() time like the default event loop clock
+        self._deadline = 0.0
+        self._reported_deadline = 0.0
+        self._last_log_time = float('-inf')
+        self._suppressed = 0
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._blocked = EVENT_LOOP_BLOCKED.labels()
+        self._deadline = time.monotonic() + self.interval
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._probe(), name='loop-monitor')
+        self._watchdog = threading.Thread(target=self._watch, name='loop-monitor-watchdog', daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+
+    async def _probe(self) -> None:
+        lag = EVENT_LOOP_LAG.labels()
+        while True:
+            self._deadline = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag.observe(max(time.monotonic() - self._deadline, 0.0))
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.slow_callback / 2):
+            deadline = self._deadline
+            overdue = time.monotonic() - deadline
+            if overdue < self.slow_callback or deadline == self._reported_deadline:
+                continue
+            # One report per blocked episode, the stack is taken while the loop is still blocked
+            self._reported_deadline = deadline
+            try:
+                # Runs once the loop is unblocked
+                self._loop.call_soon_threadsafe(self._blocked.inc)
+            except RuntimeError:
+                # The loop is closed
+                return
+            now = time.monotonic()
+            if now - self._last_log_time < self.log_interval:
+                self._suppressed += 1
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            task = asyncio.current_task(self._loop)
+            suppressed, self._suppressed = self._suppressed, 0
+            self._last_log_time = now
+            log.warning(
+                'Event loop blocked for more than {:.3f}s in task {} ({} similar reports suppressed), stack:\n{}',
+                overdue,
+                task.get_name() if task is not None else '-',
+                suppressed,
+                ''.join(traceback.format_stack(frame)),
+            )
+
+
+loop_monitor = LoopMonitor()
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import glob
+import math
+import mmap
+import os
+import shutil
+import struct
+import time
+
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, Iterator, Sequence
+
+from msgspec import json
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from backend.core.conf import settings
+
+_HEADER = struct.Struct('<Q')  # Used bytes of the file
+_KEY_LENGTH = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+_INITIAL_SIZE = 64 * 1024
+
+# File kinds, values of counter files outlive their process, gauge files are removed with it
+_COUNTER = 'counter'
+_GAUGE = 'gauge'
+
+
+def _entry_padding(key_length: int) -> int:
+    # Key length and key bytes padded to 8 bytes, so values stay aligned
+    return (_KEY_LENGTH.size + key_length + 7) // 8 * 8
+
+
+def _read_entries(buffer: Any, used: int) -> Iterator[tuple[str, int, float]]:
+    offset = _HEADER.size
+    while offset < used:
+        (length,) = _KEY_LENGTH.unpack_from(buffer, offset)
+        key = bytes(buffer[offset + _KEY_LENGTH.size : offset + _KEY_LENGTH.size + length]).decode()
+        position = offset + _entry_padding(length)
+        (value,) = _VALUE.unpack_from(buffer, position)
+        yield key, position, value
+        offset = position + _VALUE.size
+
+
+class MmapValues:
+    """
+    Float values of one process in a memory mapped file, appended by key
+
+    The owning process is the only writer and only writes from its event loop thread, so no lock is taken.
+    Readers in other processes parse up to the used size in the header, which is updated after each new entry
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(_INITIAL_SIZE)
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+        self._used = _HEADER.unpack_from(self._mmap, 0)[0] or _HEADER.size
+        self._positions = {key: position for key, position, _ in _read_entries(self._mmap, self._used)}
+
+    def _append(self, key: str) -> int:
+        encoded = key.encode()
+        padding = _entry_padding(len(encoded))
+        needed = self._used + padding + _VALUE.size
+        if needed > len(self._mmap):
+            size = len(self._mmap)
+            while size < needed:
+                size *= 2
+            self._mmap.close()
+            self._file.truncate(size)
+            self._mmap = mmap.mmap(self._file.fileno(), 0)
+        offset = self._used
+        _KEY_LENGTH.pack_into(self._mmap, offset, len(encoded))
+        self._mmap[offset + _KEY_LENGTH.size : offset + _KEY_LENGTH.size + len(encoded)] = encoded
+        position = offset + padding
+        _VALUE.pack_into(self._mmap, position, 0.0)
+        self._used = needed
+        _HEADER.pack_into(self._mmap, 0, self._used)
+        self._positions[key] = position
+        return position
+
+    def inc(self, key: str, amount: float) -> None:
+        position = self._positions.get(key)
+        if position is None:
+            position = self._append(key)
+        _VALUE.pack_into(self._mmap, position, _VALUE.unpack_from(self._mmap, position)[0] + amount)
+
+    def set(self, key: str, value: float) -> None:
+        position = self._positions.get(key)
+        if position is None:
+            position = self._append(key)
+        _VALUE.pack_into(self._mmap, position, value)
+
+    def close(self) -> None:
+        self._mmap.close()
+        self._file.close()
+
+
+# Value files of the current process, reset in forked children
+_process_values: dict[str, MmapValues] = {}
+
+
+def _values(kind: str) -> MmapValues:
+    values = _process_values.get(kind)
+    if values is None:
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        values = _process_values[kind] = MmapValues(os.path.join(settings.METRICS_DIR, f'{kind}_{os.getpid()}.db'))
+    return values
+
+
+os.register_at_fork(after_in_child=_process_values.clear)
+
+
+def _sample_key(name: str, suffix: str, labels: Sequence[tuple[str, str]]) -> str:
+    return json.encode([name, suffix, labels]).decode()
+
+
+class _NoopChild:
+    __slots__ = ()
+
+    def inc(self, amount: float = 1.0) -> None:
+        pass
+
+    def dec(self, amount: float = 1.0) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+
+_NOOP_CHILD = _NoopChild()
+
+
+class _Metric:
+    type: str = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], Any] = {}
+        _registry[name] = self
+
+    def _child(self, labels: tuple[tuple[str, str], ...]) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *labelvalues: Any) -> Any:
+        """
+        Get the child of the label values, children are cached so recording only costs a dict lookup
+
+        :param labelvalues:
+        :return:
+        """
+        if not settings.METRICS_ENABLED:
+            return _NOOP_CHILD
+        child = self._children.get(labelvalues)
+        if child is None:
+            labels = tuple(zip(self.labelnames, map(str, labelvalues)))
+            child = self._children[labelvalues] = self._child(labels)
+        return child
+
+
+class _CounterChild:
+    __slots__ = ('_key',)
+
+    def __init__(self, key: str):
+        self._key = key
+
+    def inc(self, amount: float = 1.0) -> None:
+        _values(_COUNTER).inc(self._key, amount)
+
+
+class Counter(_Metric):
+    """Monotonic counter, summed over all processes that ever ran"""
+
+    type = 'counter'
+
+    def _child(self, labels: tuple[tuple[str, str], ...]) -> _CounterChild:
+        return _CounterChild(_sample_key(self.name, '_total', labels))
+
+
+class _GaugeChild:
+    __slots__ = ('_key',)
+
+    def __init__(self, key: str):
+        self._key = key
+
+    def inc(self, amount: float = 1.0) -> None:
+        _values(_GAUGE).inc(self._key, amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        _values(_GAUGE).inc(self._key, -amount)
+
+    def set(self, value: float) -> None:
+        _values(_GAUGE).set(self._key, value)
+
+
+class Gauge(_Metric):
+    """Gauge, summed over the live processes"""
+
+    type = 'gauge'
+
+    def _child(self, labels: tuple[tuple[str, str], ...]) -> _GaugeChild:
+        return _GaugeChild(_sample_key(self.name, '', labels))
+
+
+class _HistogramChild:
+    __slots__ = ('_buckets', '_bucket_keys', '_sum_key', '_count_key')
+
+    def __init__(self, name: str, buckets: tuple[float, ...], labels: tuple[tuple[str, str], ...]):
+        self._buckets = buckets
+        self._bucket_keys = tuple(_sample_key(name, '_bucket', (*labels, ('le', _format_value(le)))) for le in buckets)
+        self._sum_key = _sample_key(name, '_sum', labels)
+        self._count_key = _sample_key(name, '_count', labels)
+
+    def observe(self, value: float) -> None:
+        # Buckets are stored per interval and made cumulative when collected, one write per observation
+        values = _values(_COUNTER)
+        values.inc(self._bucket_keys[bisect_left(self._buckets, value)], 1.0)
+        values.inc(self._sum_key, value)
+        values.inc(self._count_key, 1.0)
+
+
+class Histogram(_Metric):
+    """Histogram, summed over all processes that ever ran"""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), *, buckets: Sequence[float]):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + ((math.inf,) if buckets[-1] != math.inf else ())
+
+    def _child(self, labels: tuple[tuple[str, str], ...]) -> _HistogramChild:
+        return _HistogramChild(self.name, self.buckets, labels)
+
+
+_registry: dict[str, _Metric] = {}
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else f'{int(value)}.0'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Sequence[Sequence[str]]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def collect() -> str:
+    """
+    Merge the value files of all worker processes into the Prometheus text exposition format
+
+    :return:
+    """
+    samples: dict[tuple[str, str, tuple], float] = defaultdict(float)
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.db')):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            continue
+        if len(data) < _HEADER.size:
+            continue
+        (used,) = _HEADER.unpack_from(data, 0)
+        for key, _, value in _read_entries(data, min(used, len(data))):
+            name, suffix, labels = json.decode(key)
+            samples[(name, suffix, tuple(map(tuple, labels)))] += value
+
+    by_metric: dict[str, list[tuple[str, tuple, float]]] = defaultdict(list)
+    for (name, suffix, labels), value in samples.items():
+        by_metric[name].append((suffix, labels, value))
+
+    lines = []
+    for name in sorted(by_metric):
+        metric = _registry.get(name)
+        if metric is None:
+            continue
+        exposed_name = f'{name}_total' if metric.type == 'counter' else name
+        lines.append(f'# HELP {exposed_name} {_escape(metric.documentation)}')
+        lines.append(f'# TYPE {exposed_name} {metric.type}')
+        if metric.type != 'histogram':
+            for suffix, labels, value in sorted(by_metric[name]):
+                lines.append(f'{name}{suffix}{_format_labels(labels)} {value!r}')
+            continue
+        series: dict[tuple, dict[str, Any]] = defaultdict(lambda: {'buckets': defaultdict(float)})
+        for suffix, labels, value in by_metric[name]:
+            if suffix == '_bucket':
+                *series_labels, (_, le) = labels
+                series[tuple(series_labels)]['buckets'][float(le)] += value
+            else:
+                series[labels][suffix] = value
+        for labels in sorted(series):
+            cumulative = 0.0
+            for le in metric.buckets:
+                cumulative += series[labels]['buckets'].get(le, 0.0)
+                bucket_labels = (*labels, ('le', _format_value(le)))
+                lines.append(f'{name}_bucket{_format_labels(bucket_labels)} {cumulative!r}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {series[labels].get("_sum", 0.0)!r}')
+            lines.append(f'{name}_count{_format_labels(labels)} {series[labels].get("_count", 0.0)!r}')
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def mark_process_dead(pid: int) -> None:
+    """
+    Remove the gauge file of a stopped process, its counters and histograms are kept
+
+    :param pid:
+    :return:
+    """
+    if pid == os.getpid() and _GAUGE in _process_values:
+        _process_values.pop(_GAUGE).close()
+    try:
+        os.remove(os.path.join(settings.METRICS_DIR, f'{_GAUGE}_{pid}.db'))
+    except FileNotFoundError:
+        pass
+
+
+def clear_metrics_dir() -> None:
+    """
+    Remove the value files of previous runs, call once in the master process before workers start
+
+    :return:
+    """
+    shutil.rmtree(settings.METRICS_DIR, ignore_errors=True)
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+
+
+# HTTP
+HTTP_REQUESTS = Counter('http_requests', 'Total HTTP requests', ('method', 'route', 'status'))
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds',
+    'HTTP request duration in seconds',
+    ('method', 'route'),
+    buckets=settings.METRICS_LATENCY_BUCKETS,
+)
+HTTP_RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes',
+    'HTTP response body size in bytes',
+    ('method', 'route'),
+    buckets=settings.METRICS_SIZE_BUCKETS,
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge('http_requests_in_progress', 'HTTP requests in progress', ('method',))
+
+# Database
+DB_QUERY_DURATION = Histogram(
+    'db_query_duration_seconds',
+    'Database statement execution duration in seconds',
+    buckets=settings.METRICS_LATENCY_BUCKETS,
+)
+DB_QUERY_ERRORS = Counter('db_query_errors', 'Database statement errors')
+DB_POOL_CHECKED_OUT = Gauge('db_pool_checked_out', 'Database connections checked out of the pool')
+
+# Redis
+REDIS_COMMAND_DURATION = Histogram(
+    'redis_command_duration_seconds',
+    'Redis command duration in seconds',
+    ('command',),
+    buckets=settings.METRICS_LATENCY_BUCKETS,
+)
+REDIS_COMMAND_ERRORS = Counter('redis_command_errors', 'Redis command errors', ('command',))
+REDIS_CLIENT_CACHE_REQUESTS = Counter(
+    'redis_client_cache_requests', 'Reads of tracked keys through the redis client side cache', ('result',)
+)
+REDIS_CLIENT_CACHE_INVALIDATIONS = Counter(
+    'redis_client_cache_invalidations', 'Values dropped from the redis client side cache by invalidation'
+)
+REDIS_CLIENT_CACHE_SIZE = Gauge('redis_client_cache_size', 'Values in the redis client side cache')
+
+# Captcha
+CAPTCHA_GENERATION_DURATION = Histogram(
+    'captcha_generation_duration_seconds',
+    'Captcha image generation duration in the thread pool in seconds',
+    buckets=settings.METRICS_LATENCY_BUCKETS,
+)
+CAPTCHA_GENERATIONS_IN_PROGRESS = Gauge(
+    'captcha_generations_in_progress', 'Captcha images being generated in the thread pool'
+)
+
+# Event loop
+EVENT_LOOP_LAG = Histogram(
+    'event_loop_lag_seconds',
+    'Event loop scheduling lag in seconds',
+    buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5],
+)
+EVENT_LOOP_BLOCKED = Counter('event_loop_blocked', 'Event loop blocked longer than the slow callback threshold')
+
+# Concurrency limiter
+CONCURRENCY_LIMIT = Gauge('concurrency_limit', 'Adaptive concurrency limit')
+CONCURRENCY_IN_FLIGHT = Gauge('concurrency_in_flight', 'Requests holding a concurrency slot')
+CONCURRENCY_QUEUE_SIZE = Gauge('concurrency_queue_size', 'Requests waiting for a concurrency slot', ('priority',))
+CONCURRENCY_QUEUE_WAIT = Histogram(
+    'concurrency_queue_wait_seconds',
+    'Wait for a concurrency slot in seconds',
+    ('priority',),
+    buckets=settings.METRICS_LATENCY_BUCKETS,
+)
+CONCURRENCY_REJECTED = Counter(
+    'concurrency_rejected', 'Requests rejected by the concurrency limiter', ('priority', 'reason')
+)
+
+# Deadlines and cancellation
+HTTP_REQUESTS_CANCELLED = Counter(
+    'http_requests_cancelled', 'Requests cancelled because the client disconnected', ('method',)
+)
+DB_SESSIONS_INVALIDATED = Counter('db_sessions_invalidated', 'Database sessions invalidated by request cancellation')
+DEADLINE_EXCEEDED = Counter('deadline_exceeded', 'Database statements stopped at the request deadline', ('stage',))
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    Record statement durations, errors and checked out connections of an engine
+
+    :param engine:
+    :return:
+    """
+    sync_engine = engine.sync_engine
+
+    # Start times live on the execution context, which is discarded whether or not the statement ran
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.metrics_start_time = time.perf_counter()
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERY_DURATION.labels().observe(time.perf_counter() - context.metrics_start_time)
+
+    @event.listens_for(sync_engine, 'handle_error')
+    def handle_error(context):
+        DB_QUERY_ERRORS.labels().inc()
+
+    @event.listens_for(sync_engine.pool, 'checkout')
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKED_OUT.labels().inc()
+
+    @event.listens_for(sync_engine.pool, 'checkin')
+    def checkin(dbapi_connection, connection_record):
+        DB_POOL_CHECKED_OUT.labels().dec()
@@ -3,13 +3,14 @@
 from __future__ import annotations
 
 from math import ceil
-from typing import TYPE_CHECKING, Generic, Sequence, TypeVar
+from typing import TYPE_CHECKING, Annotated, Any, Callable, Generic, Sequence, TypeVar
 
 from fastapi import Depends, Query
 from fastapi_pagination import pagination_ctx
 from fastapi_pagination.bases import AbstractPage, AbstractParams, RawParams
 from fastapi_pagination.ext.sqlalchemy import paginate
 from fastapi_pagination.links.bases import create_links
+from msgspec import Meta, Struct
 from pydantic import BaseModel, Field
 
 if TYPE_CHECKING:
@@ -103,18 +104,72 @@ class PageData(_PageDetails, Generic[SchemaT]):
     items: Sequence[SchemaT]
 
 
-async def paging_data(db: AsyncSession, select: Select) -> dict:
+class _LinksStruct(Struct):
+    first: Annotated[str, Meta(description='First page link')]
+    last: Annotated[str, Meta(description='Last page link')]
+    self: Annotated[str, Meta(description='Current page link')]
+    next: Annotated[str | None, Meta(description='Next page link')] = None
+    prev: Annotated[str | None, Meta(description='Previous page link')] = None
+
+
+class PageDataStruct(Struct, Generic[SchemaT]):
+    """
+    Unified msgspec page model, suitable for paginated APIs that return ``response_base.fast_success``
+
+    E.g. ::
+
+        @router.get('/test', openapi_extra=struct_response_schema(ResponseStructModel[PageDataStruct[GetApiStruct]]))
+        async def test(db: CurrentSession) -> Response:
+            page_data = await paging_struct(db, select(...), transformer=...)
+            return response_base.fast_success(data=page_data)
+    """
+
+    items: Annotated[list[SchemaT], Meta(description='Current page data')]
+    total: Annotated[int, Meta(description='Total count')]
+    page: Annotated[int, Meta(description='Current page')]
+    size: Annotated[int, Meta(description='Items per page')]
+    total_pages: Annotated[int, Meta(description='Total pages')]
+    links: _LinksStruct
+
+
+async def paging_data(
+    db: AsyncSession, select: Select, transformer: Callable[[Sequence[Any]], Sequence[Any]] | None = None
+) -> dict:
     """
     Create paginated data based on SQLAlchemy
 
     :param db:
     :param select:
+    :param transformer: Page items transformer, e.g. converting column projection rows to dictionaries
     :return:
     """
-    paginated_data: _CustomPage = await paginate(db, select)
+    paginated_data: _CustomPage = await paginate(db, select, transformer=transformer)
     page_data = paginated_data.model_dump()
     return page_data
 
 
+async def paging_struct(
+    db: AsyncSession, select: Select, transformer: Callable[[Sequence[Any]], Sequence[Any]] | None = None
+) -> PageDataStruct:
+    """
+    Create paginated data based on SQLAlchemy, as a msgspec Struct without dumping the page model
+
+    :param db:
+    :param select:
+    :param transformer: Page items transformer, e.g. converting column projection rows to Structs
+    :return:
+    """
+    paginated_data: _CustomPage = await paginate(db, select, transformer=transformer)
+    links = paginated_data.links
+    return PageDataStruct(
+        items=paginated_data.items,
+        total=paginated_data.total,
+        page=paginated_data.page,
+        size=paginated_data.size,
+        total_pages=paginated_data.total_pages,
+        links=_LinksStruct(links.first, links.last, links.self, links.next, links.prev),
+    )
+
+
 # Pagination dependency injection
 DependsPagination = Depends(pagination_ctx(_CustomPage))
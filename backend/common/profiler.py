@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+import sys
+import threading
+import time
+
+from collections import Counter
+from types import CodeType
+from typing import Literal
+
+from msgspec import json
+
+from backend.core.conf import settings
+from backend.core.path_conf import PROFILE_DIR
+
+ProfileFormat = Literal['speedscope', 'collapsed']
+
+# Labels of code objects, built once per function
+_frame_labels: dict[CodeType, str] = {}
+
+# Only one profiler samples a worker at a time
+_active_lock = threading.Lock()
+
+
+def _frame_label(code: CodeType) -> str:
+    label = _frame_labels.get(code)
+    if label is None:
+        # co_qualname is Python 3.11+
+        name = getattr(code, 'co_qualname', code.co_name)
+        label = _frame_labels[code] = f'{name} ({code.co_filename}:{code.co_firstlineno})'
+    return label
+
+
+def _task_label(task: asyncio.Task | None) -> str:
+    if task is None:
+        return 'event loop'
+    # Task names are unique per task, the coroutine name groups the tasks of the same kind
+    coro = task.get_coro()
+    return f'task {getattr(coro, "__qualname__", type(coro).__qualname__)}'
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler of the event loop thread
+
+    A daemon thread takes the stack of the event loop thread every ``interval`` seconds and counts identical stacks.
+    Each stack is rooted at the asyncio task running at that moment; with ``task`` set, samples of other tasks are
+    dropped, which profiles a single request. Work offloaded to the thread pool is not sampled
+    """
+
+    def __init__(
+        self,
+        *,
+        name: str,
+        task: asyncio.Task | None = None,
+        interval: float = settings.PROFILER_INTERVAL,
+    ) -> None:
+        self.name = name
+        self.task = task
+        self.interval = interval
+        self.loop = asyncio.get_running_loop()
+        self.thread_id = threading.get_ident()
+        self.samples: Counter[tuple[str, ...]] = Counter()
+        self.start_time = self.end_time = 0.0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> bool:
+        """
+        Start sampling, unless another profiler samples this worker
+
+        :return: Whether sampling started
+        """
+        if not _active_lock.acquire(blocking=False):
+            return False
+        self.start_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name=f'profiler-{self.name}', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.end_time = time.perf_counter()
+        _active_lock.release()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self) -> None:
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        task = asyncio.current_task(self.loop)
+        if self.task is not None and task is not self.task:
+            return
+        stack = []
+        while frame is not None:
+            stack.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        stack.append(_task_label(task))
+        stack.reverse()
+        self.samples[tuple(stack)] += 1
+
+    def collapsed(self) -> bytes:
+        """
+        Collapsed stacks, one ``frame;frame;frame count`` line per stack, the input of flamegraph.pl and inferno
+
+        :return:
+        """
+        return '\n'.join(f'{";".join(stack)} {count}' for stack, count in self.samples.items()).encode()
+
+    def speedscope(self) -> bytes:
+        """
+        Sampled profile in the speedscope file format, https://www.speedscope.app
+
+        :return:
+        """
+        frames: dict[str, int] = {}
+        samples, weights = [], []
+        for stack, count in self.samples.items():
+            samples.append([frames.setdefault(label, len(frames)) for label in stack])
+            weights.append(count * self.interval)
+        return json.encode({
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': self.name,
+            'exporter': settings.FASTAPI_TITLE,
+            'shared': {'frames': [{'name': label} for label in frames]},
+            'profiles': [
+                {
+                    'type': 'sampled',
+                    'name': self.name,
+                    'unit': 'seconds',
+                    'startValue': 0,
+                    'endValue': sum(weights),
+                    'samples': samples,
+                    'weights': weights,
+                }
+            ],
+        })
+
+    def filename(self, profile_format: ProfileFormat) -> str:
+        suffix = 'speedscope.json' if profile_format == 'speedscope' else 'collapsed.txt'
+        return f'{self.name}_{os.getpid()}_{time.strftime("%Y%m%d%H%M%S")}_{id(self):x}.{suffix}'
+
+    def write(self, filename: str) -> str:
+        """
+        Write the profile to the profile directory of the log directory, blocking file I/O
+
+        :param filename: Name from :meth:`filename`, its suffix selects the format
+        :return: File path
+        """
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, filename)
+        with open(path, 'wb') as f:
+            f.write(self.speedscope() if filename.endswith('.speedscope.json') else self.collapsed())
+        return path
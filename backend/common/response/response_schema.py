@@ -1,12 +1,13 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-from typing import Any, Generic, TypeVar
+from typing import Annotated, Any, Generic, TypeVar
 
 from fastapi import Response
+from msgspec import Meta, Struct
 from pydantic import BaseModel, Field
 
 from backend.common.response.response_code import CustomResponse, CustomResponseCode
-from backend.utils.serializers import MsgSpecJSONResponse
+from backend.utils.serializers import MsgSpecJSONResponse, format_json_values
 
 SchemaT = TypeVar('SchemaT')
 
@@ -63,6 +64,25 @@ class ResponseSchemaModel(ResponseModel, Generic[SchemaT]):
     data: SchemaT
 
 
+class ResponseStructModel(Struct, Generic[SchemaT]):
+    """
+    General unified return msgspec model with a data schema, declares the response schema of routes returning
+    ``response_base.fast_success``. It is only used for the documentation: msgspec does not validate a Struct built
+    from its constructor, so the data Struct must be built from trusted values, such as query rows, and is encoded
+    without any validation
+
+    Example::
+
+        @router.get('/test', openapi_extra=struct_response_schema(ResponseStructModel[GetApiStruct]))
+        def test() -> Response:
+            return response_base.fast_success(data=GetApiStruct(...))
+    """
+
+    code: Annotated[int, Meta(description='Return status code')]
+    msg: Annotated[str, Meta(description='Return message')]
+    data: SchemaT
+
+
 class ResponseBase:
     """Unified return methods"""
 
@@ -120,13 +140,15 @@ class ResponseBase:
 
         .. warning::
 
-            When using this return method, you cannot specify the interface parameter response_model or arrow return type
+            When using this return method, you cannot specify the interface parameter response_model or arrow
+            return type, declare the response schema with
+            ``openapi_extra=struct_response_schema(ResponseStructModel[...])`` instead
 
         :param res: Return information
         :param data: Return data
         :return:
         """
-        return MsgSpecJSONResponse({'code': res.code, 'msg': res.msg, 'data': data})
+        return MsgSpecJSONResponse({'code': res.code, 'msg': res.msg, 'data': format_json_values(data)})
 
 
 response_base: ResponseBase = ResponseBase()
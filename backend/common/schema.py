@@ -5,7 +5,7 @@ from typing import Annotated
 
 from pydantic import BaseModel, ConfigDict, EmailStr, Field, validate_email
 
-from backend.core.conf import settings
+from backend.utils.serializers import format_datetime
 
 # Custom validation error messages, reference:
 # https://github.com/pydantic/pydantic-core/blob/a5cb7382643415b716b1a7a5392914e50f726528/tests/test_errors.py#L266
@@ -124,5 +124,5 @@ class SchemaBase(BaseModel):
 
     model_config = ConfigDict(
         use_enum_values=True,
-        json_encoders={datetime: lambda x: x.strftime(settings.DATETIME_FORMAT)},
+        json_encoders={datetime: format_datetime},
     )
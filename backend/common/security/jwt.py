@@ -6,40 +6,16 @@ from fastapi import Depends, Request
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.security.utils import get_authorization_scheme_param
 from jose import ExpiredSignatureError, JWTError, jwt
-from pwdlib import PasswordHash
-from pwdlib.hashers.bcrypt import BcryptHasher
 
+from backend.app.admin.crud.crud_user import user_dao
 from backend.app.admin.model import User
 from backend.common.exception.errors import AuthorizationError, TokenError
+from backend.common.server_timing import timing_span
 from backend.core.conf import settings
 from backend.database.db import CurrentSession
 
 oauth2_schema = OAuth2PasswordBearer(tokenUrl=settings.TOKEN_URL_SWAGGER)
 
-password_hash = PasswordHash((BcryptHasher(),))
-
-
-def get_hash_password(password: str, salt: bytes | None) -> str:
-    """
-    Encrypt passwords using the hash algorithm
-
-    :param password:
-    :param salt:
-    :return:
-    """
-    return password_hash.hash(password, salt=salt)
-
-
-def password_verify(plain_password: str, hashed_password: str) -> bool:
-    """
-    Password verification
-
-    :param plain_password: The password to verify
-    :param hashed_password: The hash ciphers to compare
-    :return:
-    """
-    return password_hash.verify(plain_password, hashed_password)
-
 
 def create_access_token(sub: str) -> str:
     """
@@ -93,10 +69,9 @@ async def get_current_user(db: CurrentSession, token: str = Depends(oauth2_schem
     :param token:
     :return:
     """
-    user_id = jwt_decode(token)
-    from backend.app.admin.crud.crud_user import user_dao
-
-    user = await user_dao.get(db, user_id)
+    with timing_span('auth'):
+        user_id = jwt_decode(token)
+        user = await user_dao.get(db, user_id)
     if not user:
         raise TokenError(msg='Invalid token')
     if not user.status:
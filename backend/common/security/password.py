@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from functools import cache
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pwdlib import PasswordHash
+
+
+@cache
+def _password_hash() -> 'PasswordHash':
+    # The hash backends are only needed by login, registration and password changes, they are imported on first use
+    # rather than at worker startup
+    from pwdlib import PasswordHash
+    from pwdlib.hashers.bcrypt import BcryptHasher
+
+    return PasswordHash((BcryptHasher(),))
+
+
+def get_hash_password(password: str, salt: bytes | None) -> str:
+    """
+    Encrypt passwords using the hash algorithm
+
+    :param password:
+    :param salt:
+    :return:
+    """
+    return _password_hash().hash(password, salt=salt)
+
+
+def password_verify(plain_password: str, hashed_password: str) -> bool:
+    """
+    Password verification
+
+    :param plain_password: The password to verify
+    :param hashed_password: The hash ciphers to compare
+    :return:
+    """
+    return _password_hash().verify(plain_password, hashed_password)
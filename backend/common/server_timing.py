@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+class ServerTiming:
+    """
+    Time spent per component during one request, in seconds
+
+    Spans of the same name are summed, spans of different names may overlap, e.g. ``auth`` includes the ``db``
+    time of the user lookup
+    """
+
+    __slots__ = ('start_time', 'spans')
+
+    def __init__(self) -> None:
+        self.start_time = time.perf_counter()
+        self.spans: dict[str, list] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        span = self.spans.get(name)
+        if span is None:
+            self.spans[name] = [seconds, 1]
+        else:
+            span[0] += seconds
+            span[1] += 1
+
+    def header(self) -> str:
+        """
+        Server-Timing header value, durations in milliseconds
+
+        :return:
+        """
+        metrics = [f'{name};dur={seconds * 1000:.3f};desc="{count}x"' for name, (seconds, count) in self.spans.items()]
+        metrics.append(f'total;dur={(time.perf_counter() - self.start_time) * 1000:.3f}')
+        return ', '.join(metrics)
+
+    def __format__(self, format_spec: str) -> str:
+        # Formatted by the access log, only when the record is emitted
+        return ' '.join(f'{name}={seconds * 1000:.3f}ms/{count}' for name, (seconds, count) in self.spans.items())
+
+
+_server_timing: ContextVar[ServerTiming | None] = ContextVar('server_timing', default=None)
+
+
+def start_server_timing() -> tuple[ServerTiming, object]:
+    """
+    Start timing the current request
+
+    :return: Timing and the token to reset the context with
+    """
+    timing = ServerTiming()
+    return timing, _server_timing.set(timing)
+
+
+def reset_server_timing(token: object) -> None:
+    _server_timing.reset(token)
+
+
+def record_timing(name: str, seconds: float) -> None:
+    """
+    Add a span to the timing of the current request, outside of a request it is a no-op
+
+    :param name: Server-Timing metric name
+    :param seconds:
+    :return:
+    """
+    timing = _server_timing.get()
+    if timing is not None:
+        timing.add(name, seconds)
+
+
+@contextmanager
+def timing_span(name: str) -> Iterator[None]:
+    """
+    Time the block as a span of the current request
+
+    :param name: Server-Timing metric name
+    :return:
+    """
+    timing = _server_timing.get()
+    if timing is None:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - start_time)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    Record statement execution of an engine as ``db`` spans
+
+    :param engine:
+    :return:
+    """
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.server_timing_start_time = time.perf_counter()
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        record_timing('db', time.perf_counter() - context.server_timing_start_time)
@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import os
+import tempfile
+
 from functools import lru_cache
 from typing import Literal
 
@@ -47,6 +50,7 @@ class Settings(BaseSettings):
     FASTAPI_STATIC_FILES: bool = False
 
     # MYSQL
+    DATABASE_DRIVER: Literal['asyncmy', 'aiomysql'] = 'asyncmy'  # aiomysql needs to be installed separately
     DATABASE_ECHO: bool = False
     DATABASE_POOL_ECHO: bool = False
     DATABASE_SCHEMA: str = 'fsm'
@@ -54,6 +58,21 @@ class Settings(BaseSettings):
 
     # Redis
     REDIS_TIMEOUT: int = 10
+    REDIS_CONNECT_TIMEOUT: int = 5
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: int = 5  # Wait time for a free pooled connection, in seconds
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30  # Idle connection health check interval, in seconds
+    REDIS_MODE: Literal['standalone', 'sentinel', 'cluster'] = 'standalone'
+    REDIS_SENTINEL_NODES: list[str] = []  # host:port
+    REDIS_SENTINEL_MASTER: str = 'mymaster'
+    REDIS_SENTINEL_PASSWORD: str | None = None
+    REDIS_CLUSTER_NODES: list[str] = []  # host:port, any reachable nodes of the cluster
+
+    # Redis client side cache (server assisted invalidation, requires Redis 6+)
+    REDIS_CLIENT_CACHE: bool = False
+    REDIS_CLIENT_CACHE_PREFIXES: list[str] = []  # Keys read often and rarely written, read through `cached_get`
+    REDIS_CLIENT_CACHE_MAX_SIZE: int = 10000
+    REDIS_CLIENT_CACHE_TTL: int = 60  # Upper bound of local staleness, in seconds
 
     # Token
     TOKEN_ALGORITHM: str = 'HS256'  # Algorithm
@@ -68,6 +87,10 @@ class Settings(BaseSettings):
     LOG_FILE_FORMAT: str = '<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</> | <lvl>{level: <8}</> | <lvl>{message}</>'
     LOG_ACCESS_FILENAME: str = 'fba_access.log'
     LOG_ERROR_FILENAME: str = 'fba_error.log'
+    LOG_ACCESS_JSON_FILENAME: str = 'fba_access_json.log'
+    LOG_WRITER: bool = False  # Workers send file log lines to one writer process, on by default in gunicorn.conf.py
+    LOG_WRITER_BATCH_SIZE: int = 256  # Lines per batch sent to the writer
+    LOG_WRITER_FLUSH_INTERVAL: float = 0.2  # Maximum time a line waits in the worker, in seconds
 
     # CORS
     CORS_ALLOWED_ORIGINS: list[str] = [
@@ -84,6 +107,84 @@ class Settings(BaseSettings):
     # Middleware
     MIDDLEWARE_CORS: bool = True
     MIDDLEWARE_ACCESS: bool = True
+    MIDDLEWARE_COMPRESS: bool = True
+    MIDDLEWARE_ACCESS_SAMPLE_RATE: float = 1.0  # Share of successful requests logged, errors are always logged
+    MIDDLEWARE_ACCESS_STATUS_SAMPLE_RATES: dict[int, float] = {}  # By status class, e.g. {3: 0.1, 4: 0.5}
+    MIDDLEWARE_ACCESS_FORMAT: Literal['text', 'json'] = 'text'  # json writes msgspec JSON lines to their own file
+    MIDDLEWARE_ACCESS_BATCH_SIZE: int = 100  # JSON lines per write
+    MIDDLEWARE_ACCESS_FLUSH_INTERVAL: float = 1.0  # Maximum time a JSON line waits in the buffer, in seconds
+    MIDDLEWARE_ACCESS_REQUEST_ID_HEADER: str = 'X-Request-ID'  # Set by the proxy, generated when missing
+
+    # Response compression (zstd requires zstandard, brotli requires brotli, gzip is always available)
+    COMPRESS_ENCODINGS: list[Literal['zstd', 'br', 'gzip']] = ['zstd', 'br', 'gzip']  # Server preference order
+    COMPRESS_MINIMUM_SIZE: int = 500  # In bytes, smaller bodies are sent as they are
+    COMPRESS_OFFLOAD_SIZE: int = 256 * 1024  # In bytes, larger bodies are compressed in a worker thread
+    COMPRESS_ZSTD_LEVEL: int = 3
+    COMPRESS_BROTLI_QUALITY: int = 4
+    COMPRESS_GZIP_LEVEL: int = 6
+    COMPRESS_EXCLUDED_CONTENT_TYPES: list[str] = [
+        'image/',
+        'video/',
+        'audio/',
+        'font/woff',
+        'application/zip',
+        'application/gzip',
+        'application/x-gzip',
+        'application/zstd',
+        'application/x-7z-compressed',
+        'application/x-rar-compressed',
+        'text/event-stream',
+    ]
+
+    # Metrics (Prometheus text format, aggregated over all worker processes)
+    METRICS_ENABLED: bool = True  # Request, database, redis and captcha metrics
+    METRICS_PATH: str = '/metrics'
+    METRICS_TOKEN: str | None = None  # Set in .env to serve metrics outside dev to `Authorization: Bearer <token>`
+    # Per-process value files, cleared at server start, a tmpfs path such as /dev/shm is faster
+    METRICS_DIR: str = os.path.join(tempfile.gettempdir(), 'fsm_metrics')
+    METRICS_LATENCY_BUCKETS: list[float] = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]  # In seconds
+    METRICS_SIZE_BUCKETS: list[float] = [256, 1024, 4096, 16384, 65536, 262144, 1048576]  # In bytes
+
+    # Server-Timing (always sent in the dev environment)
+    SERVER_TIMING: bool = True
+    SERVER_TIMING_TOKEN: str | None = None  # Set in .env to expose the header in production on request
+    SERVER_TIMING_TOKEN_HEADER: str = 'X-Server-Timing-Token'
+
+    # Profiler (stack sampling of the event loop thread, output in log/profile)
+    PROFILER_TOKEN: str | None = None  # Set in .env to profile requests carrying it in the header below
+    PROFILER_TOKEN_HEADER: str = 'X-Profile-Token'
+    PROFILER_FORMAT: Literal['speedscope', 'collapsed'] = 'speedscope'
+    PROFILER_INTERVAL: float = 0.005  # Sampling interval, in seconds
+    PROFILER_MAX_SECONDS: int = 60  # Upper bound of a worker profile, in seconds
+
+    # Adaptive concurrency limit per worker, off by default as it answers 503 once the limit and queue are full
+    CONCURRENCY_LIMITER: bool = False
+    CONCURRENCY_INITIAL_LIMIT: int = 20
+    CONCURRENCY_MIN_LIMIT: int = 4
+    CONCURRENCY_MAX_LIMIT: int = 500
+    CONCURRENCY_LATENCY_TOLERANCE: float = 2.0  # Latency over this multiple of the route baseline shrinks the limit
+    CONCURRENCY_BACKOFF_RATIO: float = 0.9  # Multiplicative decrease of the limit
+    CONCURRENCY_BASELINE_WINDOW: float = 60  # Route baseline latency window, in seconds
+    CONCURRENCY_QUEUE_SIZE: int = 100  # Waiting requests beyond the limit
+    CONCURRENCY_QUEUE_TIMEOUT: float = 5  # Maximum wait in the queue, in seconds
+    CONCURRENCY_RETRY_AFTER: int = 1  # Retry-After of rejected requests, in seconds
+    CONCURRENCY_PRIORITY_PATHS: list[str] = [  # Path prefixes
+        f'{FASTAPI_API_V1_PATH}/auth',
+        f'{FASTAPI_API_V1_PATH}/monitor/health',
+        METRICS_PATH,
+    ]
+
+    # Request deadline (SELECT statements get a MAX_EXECUTION_TIME hint of the remaining time)
+    REQUEST_DEADLINE: bool = True
+    REQUEST_TIMEOUT: float = 60  # Default deadline, in seconds, keep it below nginx proxy_read_timeout
+    REQUEST_TIMEOUT_HEADER: str = 'X-Request-Timeout'  # Clients may shorten the deadline, in seconds
+    REQUEST_CANCEL_ON_DISCONNECT: bool = True  # Cancel the handler when the client goes away
+
+    # Event loop monitor
+    LOOP_MONITOR: bool = True
+    LOOP_MONITOR_INTERVAL: float = 0.5  # Lag probe interval, in seconds
+    LOOP_MONITOR_SLOW_CALLBACK: float = 0.1  # Blocking time after which the loop stack is logged, in seconds
+    LOOP_MONITOR_LOG_INTERVAL: float = 60  # Minimum time between two logged stacks, in seconds
 
     # DateTime
     DATETIME_TIMEZONE: str = 'Asia/Shanghai'
@@ -92,6 +193,14 @@ class Settings(BaseSettings):
     # Request limiter
     REQUEST_LIMITER_REDIS_PREFIX: str = 'fba:limiter'
 
+    # Response cache
+    CACHE_REDIS_PREFIX: str = 'fba:cache'
+    CACHE_LOCAL_MAX_SIZE: int = 1024  # In-process LRU entries per worker
+    CACHE_TTL: int = 60  # Fresh time, in seconds
+    CACHE_STALE_TTL: int = 30  # Stale-while-revalidate time after expiration, in seconds
+    CACHE_INVALIDATION_CHANNEL: str = 'fba:cache:invalidate'
+    CACHE_INVALIDATION_GENERATION_KEY: str = 'fba:cache:generation'
+
     # Demo mode (Only GET, OPTIONS requests are allowed)
     DEMO_MODE: bool = False
     DEMO_MODE_EXCLUDE: set[tuple[str, str]] = {
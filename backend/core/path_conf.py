@@ -11,5 +11,11 @@ ALEMBIC_VERSION_DIR = BASE_PATH / 'alembic' / 'versions'
 # Log files directory
 LOG_DIR = BASE_PATH / 'log'
 
+# Unix socket of the log writer process
+LOG_WRITER_SOCKET = LOG_DIR / 'log_writer.sock'
+
+# Profiler output directory
+PROFILE_DIR = LOG_DIR / 'profile'
+
 # Static resources directory
 STATIC_DIR = BASE_PATH / 'static'
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import os
 import os.path
+
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Depends
@@ -8,15 +10,19 @@ from fastapi_limiter import FastAPILimiter
 from fastapi_pagination import add_pagination
 
 from backend.app.router import route
+from backend.common.access_log import access_log_buffer
 from backend.common.exception.exception_handler import register_exception
 from backend.common.log import setup_logging, set_custom_logfile
+from backend.common.log_writer import set_writer_logfile
+from backend.common.loop_monitor import loop_monitor
 from backend.core.path_conf import STATIC_DIR
-from backend.database.redis import redis_client
+from backend.database.redis import close_redis, get_redis_client, invalidation_bus, open_redis
 from backend.core.conf import settings
-from backend.database.db import create_table
+from backend.database.db import add_engine_listener, close_engine, create_table, open_engine
 from backend.utils.demo_site import demo_site
-from backend.utils.health_check import http_limit_callback, ensure_unique_route_names
-from backend.utils.openapi import simplify_operation_ids
+from backend.utils.health_check import http_limit_callback, http_limit_identifier, ensure_unique_route_names
+from backend.utils.serializers import MsgSpecJSONResponse
+from backend.utils.openapi import register_struct_schemas, simplify_operation_ids
 
 
 @asynccontextmanager
@@ -26,23 +32,46 @@ async def register_init(app: FastAPI):
 
     :return:
     """
+    # Create the database engine and the redis clients in the worker, after a gunicorn preload fork
+    open_engine()
     # Create database tables
     await create_table()
     # Connect to redis
-    await redis_client.open()
+    await open_redis()
     # Initialize limiter
     await FastAPILimiter.init(
-        redis_client,
+        get_redis_client(),
         prefix=settings.REQUEST_LIMITER_REDIS_PREFIX,
+        identifier=http_limit_identifier,
         http_callback=http_limit_callback,
     )
+    # Subscribe to cache invalidation
+    await invalidation_bus.start()
+    # Monitor event loop lag
+    if settings.LOOP_MONITOR:
+        await loop_monitor.start()
 
     yield
 
-    # Close redis connection
-    await redis_client.close()
+    # Stop event loop monitor
+    if settings.LOOP_MONITOR:
+        await loop_monitor.stop()
+
+    # Unsubscribe from cache invalidation
+    await invalidation_bus.stop()
     # Close limiter
     await FastAPILimiter.close()
+    # Close redis connection
+    await close_redis()
+    # Close database connections
+    await close_engine()
+    # Write the buffered access log lines
+    access_log_buffer.flush()
+    # Drop the in-flight gauges of this worker
+    if settings.METRICS_ENABLED:
+        from backend.common.metrics import mark_process_dead
+
+        mark_process_dead(os.getpid())
 
 
 def register_app():
@@ -55,6 +84,7 @@ def register_app():
         redoc_url=settings.FASTAPI_REDOC_URL,
         openapi_url=settings.FASTAPI_OPENAPI_URL,
         lifespan=register_init,
+        default_response_class=MsgSpecJSONResponse,
     )
 
     # Register components
@@ -62,6 +92,9 @@ def register_app():
     register_static_file(app)
     register_middleware(app)
     register_router(app)
+    register_metrics(app)
+    register_server_timing()
+    register_deadline()
     register_page(app)
     register_exception(app)
 
@@ -75,7 +108,10 @@ def register_logger() -> None:
     :return:
     """
     setup_logging()
-    set_custom_logfile()
+    if settings.LOG_WRITER:
+        set_writer_logfile()
+    else:
+        set_custom_logfile()
 
 
 def register_static_file(app: FastAPI):
@@ -96,6 +132,36 @@ def register_static_file(app: FastAPI):
 
 
 def register_middleware(app) -> None:
+    # Response compression, innermost so that the access log includes its time
+    if settings.MIDDLEWARE_COMPRESS:
+        from backend.middleware.compress_middle import CompressMiddleware
+
+        app.add_middleware(CompressMiddleware)
+    # Adaptive concurrency limit, inside the request metrics so that rejections and queue waits are measured
+    if settings.CONCURRENCY_LIMITER:
+        from backend.middleware.concurrency_middle import ConcurrencyLimitMiddleware
+
+        app.add_middleware(ConcurrencyLimitMiddleware)
+    # Request deadline and cancellation on client disconnect, queued requests included
+    if settings.REQUEST_DEADLINE:
+        from backend.middleware.deadline_middle import DeadlineMiddleware
+
+        app.add_middleware(DeadlineMiddleware)
+    # Request metrics, outside of compression so that response sizes are the bytes sent
+    if settings.METRICS_ENABLED:
+        from backend.middleware.metrics_middle import MetricsMiddleware
+
+        app.add_middleware(MetricsMiddleware)
+    # Request profiling, only with a token
+    if settings.PROFILER_TOKEN:
+        from backend.middleware.profiler_middle import ProfilerMiddleware
+
+        app.add_middleware(ProfilerMiddleware)
+    # Server-Timing, inside the access log which logs the same breakdown
+    if settings.SERVER_TIMING:
+        from backend.middleware.server_timing_middle import ServerTimingMiddleware
+
+        app.add_middleware(ServerTimingMiddleware)
     # API access logging
     if settings.MIDDLEWARE_ACCESS:
         from backend.middleware.access_middle import AccessMiddleware
@@ -129,6 +195,77 @@ def register_router(app: FastAPI):
     # Extra
     ensure_unique_route_names(app)
     simplify_operation_ids(app)
+    register_struct_schemas(app)
+
+
+def register_metrics(app: FastAPI):
+    """
+    Prometheus metrics endpoint, values of all worker processes are merged from settings.METRICS_DIR
+
+    Outside the dev environment, metrics are only served to requests carrying settings.METRICS_TOKEN as a bearer
+    token, which Prometheus sends with the ``authorization`` of its scrape config
+
+    :param app: FastAPI
+    :return:
+    """
+    if not settings.METRICS_ENABLED:
+        return
+
+    import secrets
+
+    from starlette.concurrency import run_in_threadpool
+    from starlette.requests import Request
+    from starlette.responses import Response
+
+    from backend.common.metrics import collect, instrument_engine
+
+    add_engine_listener(instrument_engine)
+    expected = f'Bearer {settings.METRICS_TOKEN}'.encode() if settings.METRICS_TOKEN else None
+
+    def authorized(request: Request) -> bool:
+        if settings.ENVIRONMENT == 'dev':
+            return True
+        if expected is None:
+            return False
+        authorization = request.headers.get('Authorization')
+        return authorization is not None and secrets.compare_digest(authorization.encode(), expected)
+
+    async def metrics(request: Request) -> Response:
+        if not authorized(request):
+            return Response(status_code=401, headers={'WWW-Authenticate': 'Bearer'})
+        # Reading the value files of all workers is blocking file I/O
+        content = await run_in_threadpool(collect)
+        return Response(content, media_type='text/plain; version=0.0.4; charset=utf-8')
+
+    app.add_route(settings.METRICS_PATH, metrics, include_in_schema=False)
+
+
+def register_server_timing():
+    """
+    Database statement spans of the Server-Timing header
+
+    :return:
+    """
+    if not settings.SERVER_TIMING:
+        return
+
+    from backend.common.server_timing import instrument_engine
+
+    add_engine_listener(instrument_engine)
+
+
+def register_deadline():
+    """
+    Request deadlines of database statements
+
+    :return:
+    """
+    if not settings.REQUEST_DEADLINE:
+        return
+
+    from backend.common.deadline import instrument_engine
+
+    add_engine_listener(instrument_engine)
 
 
 def register_page(app: FastAPI):
@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import asyncio
 import sys
 
-from typing import Annotated
+from typing import Annotated, Callable
 from uuid import uuid4
 
 from fastapi import Depends
@@ -10,14 +11,15 @@ from sqlalchemy import URL
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine, AsyncEngine
 
 from backend.common.log import log
+from backend.common.metrics import DB_SESSIONS_INVALIDATED
 from backend.common.model import MappedBase
 from backend.core.conf import settings
 
 
-def create_async_engine_and_session(url: str | URL) -> tuple[AsyncEngine, async_sessionmaker[AsyncSession]]:
+def create_async_db_engine(url: str | URL) -> AsyncEngine:
     try:
         # Database engine
-        engine = create_async_engine(
+        return create_async_engine(
             url,
             echo=settings.DATABASE_ECHO,
             echo_pool=settings.DATABASE_POOL_ECHO,
@@ -33,15 +35,25 @@ def create_async_engine_and_session(url: str | URL) -> tuple[AsyncEngine, async_
     except Exception as e:
         log.error('❌ Database connection failed {}', e)
         sys.exit()
-    else:
-        db_session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
-        return engine, db_session
+
+
+def create_async_engine_and_session(url: str | URL) -> tuple[AsyncEngine, async_sessionmaker[AsyncSession]]:
+    engine = create_async_db_engine(url)
+    db_session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    return engine, db_session
 
 
 async def get_db():
     """Session generator"""
     async with async_db_session() as session:
-        yield session
+        try:
+            yield session
+        except asyncio.CancelledError:
+            # The request was cancelled, possibly in the middle of a statement, so the connection is closed
+            # instead of being rolled back and reused, which also ends the transaction on the server
+            await session.invalidate()
+            DB_SESSIONS_INVALIDATED.labels().inc()
+            raise
 
 
 async def create_table() -> None:
@@ -50,16 +62,72 @@ async def create_table() -> None:
         await coon.run_sync(MappedBase.metadata.create_all)
 
 
+def create_database_url(driver: str = settings.DATABASE_DRIVER) -> str:
+    """
+    Create database connection url
+
+    :param driver: MySQL DBAPI driver name, e.g. asyncmy, aiomysql, pymysql
+    :return:
+    """
+    return (
+        f'mysql+{driver}://{settings.DATABASE_USER}:{settings.DATABASE_PASSWORD}@{settings.DATABASE_HOST}:'
+        f'{settings.DATABASE_PORT}/{settings.DATABASE_SCHEMA}?charset={settings.DATABASE_CHARSET}'
+    )
+
+
 def uuid4_str() -> str:
     """Database engine UUID type compatibility solution"""
     return str(uuid4())
 
 
-SQLALCHEMY_DATABASE_URL = (
-    f'mysql+asyncmy://{settings.DATABASE_USER}:{settings.DATABASE_PASSWORD}@{settings.DATABASE_HOST}:'
-    f'{settings.DATABASE_PORT}/{settings.DATABASE_SCHEMA}?charset={settings.DATABASE_CHARSET}'
-)
+SQLALCHEMY_DATABASE_URL = create_database_url()
+
+# Engine of this process, created by open_engine in the lifespan
+async_engine: AsyncEngine | None = None
+# Sessions are bound to the engine of this process once it is created
+async_db_session: async_sessionmaker[AsyncSession] = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+_engine_listeners: list[Callable[[AsyncEngine], None]] = []
+
+
+def add_engine_listener(listener: Callable[[AsyncEngine], None]) -> None:
+    """
+    Call a function with the engine once it is created, e.g. to instrument it
+
+    :param listener:
+    :return:
+    """
+    _engine_listeners.append(listener)
+
+
+def open_engine() -> AsyncEngine:
+    """
+    Create the database engine and bind the sessions to it
+
+    Called in the lifespan, so with gunicorn preload_app every worker creates its own engine and pool after the fork
+    instead of inheriting those of the master
+
+    :return:
+    """
+    global async_engine
+    async_engine = create_async_db_engine(SQLALCHEMY_DATABASE_URL)
+    for listener in _engine_listeners:
+        listener(async_engine)
+    async_db_session.configure(bind=async_engine)
+    return async_engine
+
+
+async def close_engine() -> None:
+    """
+    Close the connections of the database engine
+
+    :return:
+    """
+    global async_engine
+    if async_engine is not None:
+        await async_engine.dispose()
+        async_engine = None
+
 
-async_engine, async_db_session = create_async_engine_and_session(SQLALCHEMY_DATABASE_URL)
 # Session Annotated
 CurrentSession = Annotated[AsyncSession, Depends(get_db)]
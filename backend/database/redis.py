@@ -1,24 +1,181 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import asyncio
 import sys
+import time
 
-from redis.asyncio import Redis
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, TYPE_CHECKING
+
+from redis.asyncio import BlockingConnectionPool, Redis, RedisCluster
+from redis.asyncio.client import PubSub
+from redis.asyncio.cluster import ClusterNode
+from redis.asyncio.sentinel import Sentinel, SentinelConnectionPool
 from redis.exceptions import AuthenticationError, TimeoutError
+from redis.typing import KeyT
 
 from backend.common.log import log
+from backend.common.metrics import (
+    REDIS_CLIENT_CACHE_INVALIDATIONS,
+    REDIS_CLIENT_CACHE_REQUESTS,
+    REDIS_CLIENT_CACHE_SIZE,
+    REDIS_COMMAND_DURATION,
+    REDIS_COMMAND_ERRORS,
+)
+from backend.common.server_timing import record_timing
 from backend.core.conf import settings
 
+if TYPE_CHECKING:
+    from redis.asyncio.connection import Connection
+
+
+class RedisClientCache:
+    """
+    Client side cache for read-mostly keys, invalidated by Redis server assisted client side caching
+
+    The tracking connection enables ``CLIENT TRACKING`` in broadcasting mode for the configured prefixes and
+    redirects invalidation messages to a dedicated connection subscribed to ``__redis__:invalidate``. This is the
+    RESP2 form of tracking, as the clients connect with RESP2; with RESP3 the invalidations would arrive as push
+    messages on every pooled connection that reads the keys
+
+    Only worth it for keys read far more often than written, a key read once, like a captcha, never hits and only
+    adds invalidation traffic
+
+    `Client side caching <https://redis.io/docs/latest/develop/reference/client-side-caching/>`__
+    """
+
+    invalidate_channel = '__redis__:invalidate'
+
+    def __init__(self, client: Redis, prefixes: list[str], max_size: int, ttl: int):
+        self.client = client
+        self.prefixes = tuple(prefixes)
+        self.max_size = max_size
+        self.ttl = ttl
+        self._hits = REDIS_CLIENT_CACHE_REQUESTS.labels('hit')
+        self._misses = REDIS_CLIENT_CACHE_REQUESTS.labels('miss')
+        self._invalidations = REDIS_CLIENT_CACHE_INVALIDATIONS.labels()
+        self._size = REDIS_CLIENT_CACHE_SIZE.labels()
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._fetching: dict[str, object] = {}
+        self._invalidate_conn: Connection | None = None
+        self._tracking_conn: Connection | None = None
+        self._listener: asyncio.Task | None = None
+
+    def cacheable(self, key: str) -> bool:
+        return key.startswith(self.prefixes)
+
+    async def get(self, key: str) -> Any:
+        """
+        Get key value, read from the local cache first
+
+        :param key:
+        :return:
+        """
+        item = self._data.get(key)
+        if item is not None and item[0] > time.monotonic():
+            self._data.move_to_end(key)
+            self._hits.inc()
+            return item[1]
+        self._misses.inc()
+        # An invalidation that arrives while the value is in flight discards it
+        self._fetching[key] = token = object()
+        try:
+            value = await self.client.get(key)
+        finally:
+            fetching = self._fetching.get(key)
+            if fetching is token:
+                del self._fetching[key]
+        if fetching is token and self._listener is not None:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            if len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+            self._size.set(len(self._data))
+        return value
+
+    def invalidate(self, keys: list[str] | None) -> None:
+        """
+        Drop local values, ``None`` drops all of them
+
+        :param keys:
+        :return:
+        """
+        if keys is None:
+            self._invalidations.inc(len(self._data))
+            self._data.clear()
+            self._fetching.clear()
+            self._size.set(0)
+            return
+        for key in keys:
+            self._fetching.pop(key, None)
+            if self._data.pop(key, None) is not None:
+                self._invalidations.inc()
+        self._size.set(len(self._data))
+
+    async def start(self) -> None:
+        await self._connect()
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        await self._disconnect()
+        self.invalidate(None)
+
+    async def _connect(self) -> None:
+        pool = self.client.connection_pool
+        self._invalidate_conn = pool.make_connection()
+        await self._invalidate_conn.connect()
+        await self._invalidate_conn.send_command('CLIENT', 'ID')
+        client_id = await self._invalidate_conn.read_response()
+        await self._invalidate_conn.send_command('SUBSCRIBE', self.invalidate_channel)
+        await self._invalidate_conn.read_response()
+        self._tracking_conn = pool.make_connection()
+        await self._tracking_conn.connect()
+        args = ['CLIENT', 'TRACKING', 'ON', 'REDIRECT', client_id, 'BCAST']
+        for prefix in self.prefixes:
+            args.extend(('PREFIX', prefix))
+        await self._tracking_conn.send_command(*args)
+        await self._tracking_conn.read_response()
+        # Values cached before tracking was (re)established may have missed invalidations
+        self.invalidate(None)
+
+    async def _disconnect(self) -> None:
+        for conn in (self._invalidate_conn, self._tracking_conn):
+            if conn is not None:
+                await conn.disconnect()
+        self._invalidate_conn = self._tracking_conn = None
+
+    async def _listen(self) -> None:
+        interval = settings.REDIS_HEALTH_CHECK_INTERVAL or 30
+        while True:
+            try:
+                message = await self._invalidate_conn.read_response(timeout=interval)
+                if message is None:
+                    # Tracking is bound to the tracking connection, keep it alive and detect its loss
+                    await self._tracking_conn.send_command('PING')
+                    await self._tracking_conn.read_response()
+                elif message[0] == 'message' and message[1] == self.invalidate_channel:
+                    self.invalidate(message[2])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning('Redis client cache tracking lost, reconnecting: {}', e)
+                self.invalidate(None)
+                await self._disconnect()
+                await asyncio.sleep(1)
+                try:
+                    await self._connect()
+                except Exception as e:
+                    log.warning('Redis client cache tracking reconnect failed: {}', e)
 
-class RedisCli(Redis):
-    def __init__(self):
-        super(RedisCli, self).__init__(
-            host=settings.REDIS_HOST,
-            port=settings.REDIS_PORT,
-            password=settings.REDIS_PASSWORD,
-            db=settings.REDIS_DATABASE,
-            socket_timeout=settings.REDIS_TIMEOUT,
-            decode_responses=True,  # Decode as utf-8
-        )
+
+class RedisCliMixin:
+    """Shared client methods for all redis topologies"""
+
+    client_cache: RedisClientCache | None = None
+    decode_responses: bool = True
 
     async def open(self):
         """
@@ -37,28 +194,389 @@ class RedisCli(Redis):
         except Exception as e:
             log.error('❌ Redis database connection error {}', e)
             sys.exit()
+        if settings.REDIS_CLIENT_CACHE and settings.REDIS_CLIENT_CACHE_PREFIXES and self.decode_responses:
+            if settings.REDIS_MODE == 'cluster':
+                log.warning('Redis client side cache is not supported in cluster mode, skipped')
+                return
+            self.client_cache = RedisClientCache(
+                self,
+                settings.REDIS_CLIENT_CACHE_PREFIXES,
+                settings.REDIS_CLIENT_CACHE_MAX_SIZE,
+                settings.REDIS_CLIENT_CACHE_TTL,
+            )
+            await self.client_cache.start()
+
+    async def aclose(self, *args, **kwargs) -> None:
+        if self.client_cache is not None:
+            await self.client_cache.stop()
+            self.client_cache = None
+        await super().aclose(*args, **kwargs)
+
+    async def execute_command(self, *args, **options) -> Any:
+        command = args[0]
+        start_time = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        except Exception:
+            REDIS_COMMAND_ERRORS.labels(command).inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start_time
+            REDIS_COMMAND_DURATION.labels(command).observe(elapsed)
+            record_timing('redis', elapsed)
+
+    async def cached_get(self, name: str) -> Any:
+        """
+        Get key value through the client side cache when the key is in a tracked prefix
 
-    async def delete_prefix(self, prefix: str, exclude: str | list = None):
+        :param name:
+        :return:
+        """
+        if self.client_cache is not None and self.client_cache.cacheable(name):
+            return await self.client_cache.get(name)
+        return await self.get(name)
+
+    async def delete_prefix(
+        self,
+        prefix: str,
+        exclude: str | list | None = None,
+        *,
+        count: int = 1000,
+        batch_size: int = 500,
+        concurrency: int = 4,
+        progress: Callable[[int, int], Any] | None = None,
+    ) -> int:
         """
         Delete all keys with the specified prefix
 
+        Keys are streamed with SCAN and removed with non-blocking UNLINK in fixed-size batches, at most
+        ``concurrency`` batches are in flight, so neither the worker memory nor the Redis server is blocked
+
         :param prefix:
         :param exclude:
+        :param count: SCAN COUNT hint
+        :param batch_size: Number of keys per UNLINK command
+        :param concurrency: Maximum number of in-flight UNLINK batches
+        :param progress: Progress callback, receives the number of deleted and scanned keys
+        :return: Number of deleted keys
+        """
+        excludes = {exclude} if isinstance(exclude, str) else set(exclude or ())
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks: set[asyncio.Task] = set()
+        errors: list[Exception] = []
+        deleted = scanned = 0
+
+        async def unlink(keys: list[str]) -> None:
+            nonlocal deleted
+            try:
+                deleted += await self.unlink(*keys)
+                if progress:
+                    progress(deleted, scanned)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                semaphore.release()
+
+        async def flush(keys: list[str]) -> None:
+            await semaphore.acquire()
+            task = asyncio.create_task(unlink(keys))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        batch = []
+        async for key in self.scan_iter(match=f'{prefix}*', count=count):
+            if errors:
+                break
+            scanned += 1
+            if key in excludes:
+                continue
+            batch.append(key)
+            if len(batch) >= batch_size:
+                await flush(batch)
+                batch = []
+        if batch:
+            await flush(batch)
+        if tasks:
+            await asyncio.gather(*tasks)
+        if errors:
+            raise errors[0]
+        log.debug('Redis prefix {} deleted {} of {} scanned keys', prefix, deleted, scanned)
+        return deleted
+
+
+class RedisCli(RedisCliMixin, Redis):
+    """Standalone or sentinel managed redis client"""
+
+    def __init__(self, *, decode_responses: bool = True):
+        connection_kwargs = {
+            'password': settings.REDIS_PASSWORD,
+            'db': settings.REDIS_DATABASE,
+            'socket_timeout': settings.REDIS_TIMEOUT,
+            'socket_connect_timeout': settings.REDIS_CONNECT_TIMEOUT,
+            'socket_keepalive': True,
+            'health_check_interval': settings.REDIS_HEALTH_CHECK_INTERVAL,
+            'max_connections': settings.REDIS_MAX_CONNECTIONS,
+            'decode_responses': decode_responses,  # Decode as utf-8
+        }
+        if settings.REDIS_MODE == 'sentinel':
+            sentinel = Sentinel(
+                [_parse_node(node) for node in settings.REDIS_SENTINEL_NODES],
+                sentinel_kwargs={'password': settings.REDIS_SENTINEL_PASSWORD},
+                socket_timeout=settings.REDIS_TIMEOUT,
+            )
+            # Master address is resolved by the sentinels on every (re)connection, so failover needs no restart
+            connection_pool = SentinelConnectionPool(settings.REDIS_SENTINEL_MASTER, sentinel, **connection_kwargs)
+        else:
+            connection_pool = BlockingConnectionPool(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                timeout=settings.REDIS_POOL_TIMEOUT,
+                **connection_kwargs,
+            )
+        super(RedisCli, self).__init__(connection_pool=connection_pool)
+        # The pool is owned by this client, close it together with the client
+        self.auto_close_connection_pool = True
+        self.decode_responses = decode_responses
+
+    async def mget_nonatomic(self, keys: KeyT | Iterable[KeyT], *args: KeyT) -> list[Any]:
+        """
+        Get the values of keys, the same as ``RedisClusterCli.mget_nonatomic`` which splits the keys by hash slot, so
+        callers read keys of any slots through either client
+
+        :param keys:
+        :param args:
         :return:
         """
-        keys = []
-        async for key in self.scan_iter(match=f'{prefix}*'):
-            if isinstance(exclude, str):
-                if key != exclude:
-                    keys.append(key)
-            elif isinstance(exclude, list):
-                if key not in exclude:
-                    keys.append(key)
-            else:
-                keys.append(key)
-        if keys:
-            await self.delete(*keys)
-
-
-# Create redis client singleton
-redis_client: RedisCli = RedisCli()
+        return await self.mget(keys, *args)
+
+
+class RedisClusterCli(RedisCliMixin, RedisCluster):
+    """Redis cluster client, keys are routed by hash slot and multi-key commands are split across slots"""
+
+    def __init__(self, *, decode_responses: bool = True):
+        super(RedisClusterCli, self).__init__(
+            startup_nodes=[ClusterNode(*_parse_node(node)) for node in settings.REDIS_CLUSTER_NODES],
+            password=settings.REDIS_PASSWORD,
+            socket_timeout=settings.REDIS_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+            socket_keepalive=True,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            decode_responses=decode_responses,  # Decode as utf-8
+        )
+        self.decode_responses = decode_responses
+
+
+def _parse_node(node: str) -> tuple[str, int]:
+    host, _, port = node.rpartition(':')
+    return host, int(port)
+
+
+def create_redis_client(*, decode_responses: bool = True) -> RedisCli | RedisClusterCli:
+    """
+    Create redis client for the topology configured by REDIS_MODE
+
+    :param decode_responses: Decode responses as utf-8 strings, binary values need a client without decoding
+    :return:
+    """
+    if settings.REDIS_MODE == 'cluster':
+        return RedisClusterCli(decode_responses=decode_responses)
+    return RedisCli(decode_responses=decode_responses)
+
+
+def redis_key(prefix: str, tag: Any, *parts: Any) -> str:
+    """
+    Build a redis key with a hash tag, e.g. ``prefix:{tag}:part``
+
+    Only the tag decides the cluster hash slot, so keys of the same entity are stored together and can be used in
+    multi-key commands, while different entities still spread over all cluster nodes
+
+    :param prefix: Key prefix, must not contain a hash tag itself
+    :param tag: Entity identifier
+    :param parts: Extra key parts
+    :return:
+    """
+    return ':'.join((prefix, f'{{{tag}}}', *map(str, parts)))
+
+
+# Redis clients of this process, created by open_redis in the lifespan
+_redis_client: RedisCli | RedisClusterCli | None = None
+_redis_binary_client: RedisCli | RedisClusterCli | None = None
+
+
+async def open_redis() -> None:
+    """
+    Create and connect the redis clients
+
+    Called in the lifespan, so with gunicorn preload_app every worker creates its own clients and connection pools
+    after the fork instead of inheriting those of the master
+
+    :return:
+    """
+    global _redis_client, _redis_binary_client
+    _redis_client = create_redis_client()
+    _redis_binary_client = create_redis_client(decode_responses=False)
+    await _redis_client.open()
+    await _redis_binary_client.open()
+
+
+async def close_redis() -> None:
+    """
+    Close the redis clients
+
+    :return:
+    """
+    global _redis_client, _redis_binary_client
+    for client in (_redis_client, _redis_binary_client):
+        if client is not None:
+            await client.aclose()
+    _redis_client = _redis_binary_client = None
+
+
+def get_redis_client() -> RedisCli | RedisClusterCli:
+    """
+    Redis client, values are returned as utf-8 strings
+
+    :return:
+    """
+    if _redis_client is None:
+        raise RuntimeError('Redis client is not open, open_redis runs in the lifespan')
+    return _redis_client
+
+
+def get_redis_binary_client() -> RedisCli | RedisClusterCli:
+    """
+    Redis client, values are returned as bytes, e.g. msgpack cache values
+
+    :return:
+    """
+    if _redis_binary_client is None:
+        raise RuntimeError('Redis client is not open, open_redis runs in the lifespan')
+    return _redis_binary_client
+
+
+class RedisInvalidationBus:
+    """
+    Cross-worker cache invalidation bus over redis pub/sub
+
+    Every message carries a generation from a shared redis counter. A worker that sees a gap in the generations,
+    or a different generation after reconnecting, has missed messages and flushes its local caches instead
+    """
+
+    # Increment the generation and publish in one step, so messages are published in generation order
+    _publish_script = """
+    local generation = redis.call('INCR', KEYS[1])
+    redis.call('PUBLISH', ARGV[1], generation .. '|' .. ARGV[2])
+    return generation
+    """
+
+    def __init__(self, channel: str, generation_key: str):
+        self.channel = channel
+        self.generation_key = generation_key
+        self.generation: int | None = None
+        self._handlers: list[Callable[[list[str] | None], Any]] = []
+        self._listener: asyncio.Task | None = None
+
+    def add_handler(self, handler: Callable[[list[str] | None], Any]) -> None:
+        """
+        Register a local invalidation handler, it receives the invalidated tags, or ``None`` to flush everything
+
+        :param handler:
+        :return:
+        """
+        self._handlers.append(handler)
+
+    async def publish(self, *tags: str) -> None:
+        """
+        Publish invalidation tags to all workers
+
+        :param tags:
+        :return:
+        """
+        try:
+            await get_redis_client().eval(self._publish_script, 1, self.generation_key, self.channel, '\n'.join(tags))
+        except Exception as e:
+            log.warning('Cache invalidation publish failed: {}', e)
+
+    def _dispatch(self, tags: list[str] | None) -> None:
+        for handler in self._handlers:
+            try:
+                handler(tags)
+            except Exception as e:
+                log.warning('Cache invalidation handler failed: {}', e)
+
+    def _sync(self, generation: int) -> None:
+        if self.generation is not None and generation != self.generation:
+            self._dispatch(None)
+        self.generation = generation
+
+    def _on_message(self, data: str) -> None:
+        generation, _, payload = data.partition('|')
+        generation = int(generation)
+        if self.generation is not None and generation > self.generation + 1:
+            self._dispatch(None)
+        else:
+            self._dispatch(payload.split('\n') if payload else [])
+        self.generation = max(generation, self.generation or 0)
+
+    @staticmethod
+    def _pubsub() -> tuple[PubSub, Redis | None]:
+        """
+        Pub/sub of the invalidation channel
+
+        :return: The pub/sub, and in cluster mode the node client it belongs to, closed together with it
+        """
+        redis_client = get_redis_client()
+        if not isinstance(redis_client, RedisCluster):
+            return redis_client.pubsub(), None
+        # Cluster pub/sub messages are broadcast to every node, so any node can be subscribed
+        node = redis_client.get_random_node()
+        client = Redis(
+            host=node.host,
+            port=node.port,
+            password=settings.REDIS_PASSWORD,
+            socket_timeout=settings.REDIS_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+            socket_keepalive=True,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+            decode_responses=True,
+        )
+        return client.pubsub(), client
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub, node_client = self._pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                # Read the generation after subscribing, so no message falls between the two
+                self._sync(int(await get_redis_client().get(self.generation_key) or 0))
+                while True:
+                    # A read timeout returns None, unlike the socket timeout of a blocking read which drops the
+                    # subscription of an idle channel, the connection is checked by the health check pings
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=settings.REDIS_TIMEOUT)
+                    if message is not None and message['type'] == 'message':
+                        self._on_message(message['data'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning('Cache invalidation subscriber disconnected, resubscribing: {}', e)
+                self._dispatch(None)
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+                if node_client is not None:
+                    await node_client.aclose()
+
+    async def start(self) -> None:
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+
+# Create cache invalidation bus singleton
+invalidation_bus: RedisInvalidationBus = RedisInvalidationBus(
+    settings.CACHE_INVALIDATION_CHANNEL, settings.CACHE_INVALIDATION_GENERATION_KEY
+)
@@ -4,6 +4,7 @@ from pathlib import Path
 
 import uvicorn
 
+from backend.common.metrics import clear_metrics_dir
 from backend.core.registrar import register_app
 
 app = register_app()
@@ -11,6 +12,7 @@ app = register_app()
 
 if __name__ == '__main__':
     try:
+        clear_metrics_dir()
         config = uvicorn.Config(app=f'{Path(__file__).stem}:app', reload=True)
         server = uvicorn.Server(config)
         server.run()
@@ -1,21 +1,105 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+import random
+import time
 
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.common.access_log import AccessRecord, access_log_buffer, new_request_id
 from backend.common.log import log
-from backend.utils.timezone import timezone
+from backend.core.conf import settings
+from backend.middleware.metrics_middle import UNMATCHED_ROUTE
+
+_FORMAT = '{: <15} | {: <8} | {: <6} | {} | {:.3f}ms'
+# With the Server-Timing breakdown of the request
+_TIMING_FORMAT = _FORMAT + ' | {}'
+
+
+class AccessMiddleware:
+    """
+    Request logging middleware
+
+    Requests are sampled by status: errors are always logged, other requests at ``sample_rate``, a status class in
+    ``status_sample_rates`` (e.g. ``{3: 0.1}`` for 3xx) overrides both. The json format writes one msgspec encoded
+    line per request with the route template, status, latency, database time and request id, buffered and written in
+    batches
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        sample_rate: float = settings.MIDDLEWARE_ACCESS_SAMPLE_RATE,
+        status_sample_rates: dict[int, float] = settings.MIDDLEWARE_ACCESS_STATUS_SAMPLE_RATES,
+        log_format: str = settings.MIDDLEWARE_ACCESS_FORMAT,
+    ) -> None:
+        self.app = app
+        self.sample_rate = sample_rate
+        self.status_sample_rates = status_sample_rates
+        self.json = log_format == 'json'
+
+    def _sampled(self, status_code: int) -> bool:
+        rate = self.status_sample_rates.get(status_code // 100)
+        if rate is None:
+            rate = 1.0 if status_code >= 400 else self.sample_rate
+        return rate >= 1 or random.random() < rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status_code = None
+        start_time = time.perf_counter_ns()
 
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
 
-class AccessMiddleware(BaseHTTPMiddleware):
-    """Request logging middleware"""
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if status_code is None:
+                # No response, 499 like nginx when the client went away
+                status_code = 499 if scope.get('client_disconnected') else 500
+            if self._sampled(status_code):
+                elapsed_ms = (time.perf_counter_ns() - start_time) / 1_000_000
+                client = scope.get('client')
+                timing = scope.get('server_timing')
+                if self.json:
+                    self._log_json(scope, status_code, elapsed_ms, client, timing)
+                else:
+                    # Arguments are formatted by loguru, only when the message passes the level filter
+                    log.info(
+                        _TIMING_FORMAT if timing is not None and timing.spans else _FORMAT,
+                        client[0] if client else '-',
+                        scope['method'],
+                        status_code,
+                        scope['path'],
+                        elapsed_ms,
+                        timing,
+                    )
 
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
-        start_time = timezone.now()
-        response = await call_next(request)
-        end_time = timezone.now()
-        log.info(
-            f'{request.client.host: <15} | {request.method: <8} | {response.status_code: <6} | '
-            f'{request.url.path} | {round((end_time - start_time).total_seconds(), 3) * 1000.0}ms'
+    @staticmethod
+    def _log_json(scope: Scope, status_code: int, elapsed_ms: float, client, timing) -> None:
+        if timing is None:
+            db_ms, db_count = None, 0
+        else:
+            db_seconds, db_count = timing.spans.get('db', (0.0, 0))
+            db_ms = round(db_seconds * 1000, 3)
+        access_log_buffer.add(
+            AccessRecord(
+                time=time.time(),
+                request_id=Headers(scope=scope).get(settings.MIDDLEWARE_ACCESS_REQUEST_ID_HEADER) or new_request_id(),
+                client=client[0] if client else '-',
+                method=scope['method'],
+                route=getattr(scope.get('route'), 'path', UNMATCHED_ROUTE),
+                path=scope['path'],
+                status=status_code,
+                latency_ms=round(elapsed_ms, 3),
+                db_ms=db_ms,
+                db_count=db_count,
+            )
         )
-        return response
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import gzip
+import zlib
+
+from functools import lru_cache
+from typing import Callable, NamedTuple, Protocol
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.common.server_timing import timing_span
+from backend.core.conf import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class StreamCompressor(Protocol):
+    def compress(self, data: bytes) -> bytes:
+        """Compress a chunk and flush it, so that streaming clients receive it at once"""
+
+    def finish(self) -> bytes:
+        """End the stream"""
+
+
+class _GzipStreamCompressor:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliStreamCompressor:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdStreamCompressor:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class Codec(NamedTuple):
+    """One-shot and streaming compression of a content coding"""
+
+    compress: Callable[[bytes], bytes]
+    stream: Callable[[], StreamCompressor]
+
+
+def available_codecs() -> dict[str, Codec]:
+    """
+    Content codings of settings.COMPRESS_ENCODINGS whose libraries are installed, in preference order
+
+    :return:
+    """
+    zstd_level, brotli_quality, gzip_level = (
+        settings.COMPRESS_ZSTD_LEVEL,
+        settings.COMPRESS_BROTLI_QUALITY,
+        settings.COMPRESS_GZIP_LEVEL,
+    )
+    codecs = {}
+    for encoding in settings.COMPRESS_ENCODINGS:
+        if encoding == 'zstd' and zstandard is not None:
+            # Compressors are not thread safe and offloaded bodies are compressed concurrently
+            codecs[encoding] = Codec(
+                lambda data: zstandard.ZstdCompressor(level=zstd_level).compress(data),
+                lambda: _ZstdStreamCompressor(zstd_level),
+            )
+        elif encoding == 'br' and brotli is not None:
+            codecs[encoding] = Codec(
+                lambda data: brotli.compress(data, quality=brotli_quality),
+                lambda: _BrotliStreamCompressor(brotli_quality),
+            )
+        elif encoding == 'gzip':
+            codecs[encoding] = Codec(
+                lambda data: gzip.compress(data, gzip_level, mtime=0),
+                lambda: _GzipStreamCompressor(gzip_level),
+            )
+    return codecs
+
+
+def negotiate_encoding(accept_encoding: str, encodings: tuple[str, ...]) -> str | None:
+    """
+    Pick a content coding from the Accept-Encoding header, the highest q-value wins and the server preference
+    order breaks ties
+
+    :param accept_encoding: Accept-Encoding request header
+    :param encodings: Supported encodings in preference order
+    :return:
+    """
+    weights = {}
+    for item in accept_encoding.lower().split(','):
+        coding, _, params = item.partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding.strip()] = q
+    wildcard = weights.get('*', 0.0)
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressMiddleware:
+    """Response compression middleware, negotiates zstd, brotli or gzip"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = settings.COMPRESS_MINIMUM_SIZE,
+        offload_size: int = settings.COMPRESS_OFFLOAD_SIZE,
+        excluded_content_types: list[str] = settings.COMPRESS_EXCLUDED_CONTENT_TYPES,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+        self.excluded_content_types = tuple(excluded_content_types)
+        self.codecs = available_codecs()
+        # Clients send few distinct Accept-Encoding values, so their negotiation is cached
+        self.negotiate = lru_cache(maxsize=256)(lambda header: negotiate_encoding(header, tuple(self.codecs)))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = self.negotiate(Headers(scope=scope).get('accept-encoding', ''))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressResponder:
+    def __init__(self, middleware: CompressMiddleware, encoding: str, send: Send) -> None:
+        self.middleware = middleware
+        self.encoding = encoding
+        self.codec = middleware.codecs[encoding]
+        self.downstream = send
+        self.start_message: Message | None = None
+        self.stream: StreamCompressor | None = None
+        self.passthrough = False
+
+    def _skip(self, headers: MutableHeaders) -> bool:
+        content_type = headers.get('content-type', '')
+        return 'content-encoding' in headers or content_type.startswith(self.middleware.excluded_content_types)
+
+    def _set_encoding(self, headers: MutableHeaders) -> None:
+        headers['content-encoding'] = self.encoding
+        headers.add_vary_header('Accept-Encoding')
+        # The encoded body differs byte-wise, strong validators must become weak
+        etag = headers.get('etag')
+        if etag and not etag.startswith('W/'):
+            headers['etag'] = f'W/{etag}'
+
+    async def _compress(self, data: bytes, func: Callable[[bytes], bytes]) -> bytes:
+        with timing_span('compress'):
+            if len(data) >= self.middleware.offload_size:
+                return await run_in_threadpool(func, data)
+            return func(data)
+
+    async def send(self, message: Message) -> None:
+        message_type = message['type']
+        if message_type == 'http.response.start':
+            self.start_message = message
+            self.passthrough = self._skip(MutableHeaders(raw=message['headers']))
+            if self.passthrough:
+                await self.downstream(message)
+            return
+        if message_type != 'http.response.body' or self.passthrough:
+            await self.downstream(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if self.start_message is not None:
+            start_message, self.start_message = self.start_message, None
+            headers = MutableHeaders(raw=start_message['headers'])
+            if not more_body:
+                # Whole body in one message
+                if len(body) < self.middleware.minimum_size:
+                    self.passthrough = True
+                    await self.downstream(start_message)
+                    await self.downstream(message)
+                    return
+                body = await self._compress(body, self.codec.compress)
+                self._set_encoding(headers)
+                headers['content-length'] = str(len(body))
+                await self.downstream(start_message)
+                await self.downstream({'type': 'http.response.body', 'body': body})
+                return
+            # Streaming response
+            self.stream = self.codec.stream()
+            self._set_encoding(headers)
+            del headers['content-length']
+            await self.downstream(start_message)
+
+        data = await self._compress(body, self.stream.compress)
+        if not more_body:
+            data += self.stream.finish()
+        await self.downstream({'type': 'http.response.body', 'body': data, 'more_body': more_body})
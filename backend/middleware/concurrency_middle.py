@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import time
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from backend.common.concurrency import AdaptiveLimiter, Priority, Rejected
+from backend.common.response.response_code import CustomResponseCode
+from backend.core.conf import settings
+from backend.utils.serializers import MsgSpecJSONResponse
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    Adaptive per-worker concurrency limit, requests over the limit are queued and rejected with 503 when the queue
+    is full or their wait times out
+
+    Requests under settings.CONCURRENCY_PRIORITY_PATHS are admitted before the others
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        priority_paths: list[str] = settings.CONCURRENCY_PRIORITY_PATHS,
+        queue_timeout: float = settings.CONCURRENCY_QUEUE_TIMEOUT,
+    ) -> None:
+        self.app = app
+        self.priority_paths = tuple(priority_paths)
+        self.queue_timeout = queue_timeout
+        self.limiter = AdaptiveLimiter()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        priority = Priority.HIGH if scope['path'].startswith(self.priority_paths) else Priority.NORMAL
+        try:
+            await self.limiter.acquire(priority, self.queue_timeout)
+        except Rejected:
+            res = CustomResponseCode.HTTP_503
+            response = MsgSpecJSONResponse(
+                {'code': res.code, 'msg': res.msg, 'data': None},
+                status_code=res.code,
+                headers={'Retry-After': str(settings.CONCURRENCY_RETRY_AFTER)},
+            )
+            await response(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        route = None
+        try:
+            await self.app(scope, receive, send)
+            route = getattr(scope.get('route'), 'path', None)
+        finally:
+            # Failed and unmatched requests return their slot without adjusting the limit
+            self.limiter.release(route, time.perf_counter() - start_time)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.common.deadline import reset_deadline, start_deadline
+from backend.common.metrics import HTTP_REQUESTS_CANCELLED
+from backend.core.conf import settings
+
+
+class DeadlineMiddleware:
+    """
+    Request deadline and cancellation on client disconnect
+
+    The deadline is settings.REQUEST_TIMEOUT, shortened by the X-Request-Timeout request header or the
+    ``request_timeout`` route dependency. A watcher task is the only reader of the ASGI receive channel and hands the
+    messages on to the app; when the client disconnects before the response is complete, the request task is
+    cancelled, which closes its database sessions, and ``scope['client_disconnected']`` is set for the access log and
+    metrics
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        timeout: float = settings.REQUEST_TIMEOUT,
+        cancel_on_disconnect: bool = settings.REQUEST_CANCEL_ON_DISCONNECT,
+    ) -> None:
+        self.app = app
+        self.timeout = timeout
+        self.cancel_on_disconnect = cancel_on_disconnect
+
+    def _timeout(self, scope: Scope) -> float:
+        header = Headers(scope=scope).get(settings.REQUEST_TIMEOUT_HEADER)
+        if header is None:
+            return self.timeout
+        try:
+            return max(0.0, min(self.timeout, float(header)))
+        except ValueError:
+            return self.timeout
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        _, token = start_deadline(self._timeout(scope))
+        try:
+            if self.cancel_on_disconnect:
+                await self._call_cancellable(scope, receive, send)
+            else:
+                await self.app(scope, receive, send)
+        finally:
+            reset_deadline(token)
+
+    async def _call_cancellable(self, scope: Scope, receive: Receive, send: Send) -> None:
+        task = asyncio.current_task()
+        # Holds one message, so request bodies are still read at the pace of the app
+        messages: asyncio.Queue[Message] = asyncio.Queue(maxsize=1)
+        response_complete = disconnected = cancelled = False
+
+        async def watch() -> None:
+            nonlocal disconnected, cancelled
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    disconnected = True
+                    if not response_complete:
+                        cancelled = True
+                        task.cancel()
+                    elif messages.empty():
+                        messages.put_nowait(message)
+                    return
+                await messages.put(message)
+
+        async def receive_wrapper() -> Message:
+            if disconnected and messages.empty():
+                return {'type': 'http.disconnect'}
+            return await messages.get()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_complete
+            if message['type'] == 'http.response.body' and not message.get('more_body', False):
+                response_complete = True
+            await send(message)
+
+        watcher = asyncio.create_task(watch())
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except asyncio.CancelledError:
+            if not cancelled:
+                raise
+            # Python 3.11+ counts cancellation requests, the request is done with ours. On 3.10 catching the
+            # CancelledError is enough, the ``cancelled`` flag tells our cancellation apart from others
+            if hasattr(task, 'uncancel'):
+                task.uncancel()
+            scope['client_disconnected'] = True
+            HTTP_REQUESTS_CANCELLED.labels(scope['method']).inc()
+        finally:
+            watcher.cancel()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from time import perf_counter
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.common.metrics import (
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUESTS,
+    HTTP_REQUESTS_IN_PROGRESS,
+    HTTP_RESPONSE_SIZE,
+)
+from backend.core.conf import settings
+
+# Label of requests that match no route, raw paths would make the label set unbounded
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+class MetricsMiddleware:
+    """Request count, latency, response size and in-flight request metrics per route template"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or scope['path'] == settings.METRICS_PATH:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        status_code = None
+        size = 0
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, size
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            elif message['type'] == 'http.response.body':
+                size += len(message.get('body', b''))
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        start_time = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = perf_counter() - start_time
+            in_progress.dec()
+            if status_code is None:
+                status_code = 499 if scope.get('client_disconnected') else 500
+            # The router stores the matched route in the scope
+            route = scope.get('route')
+            route = getattr(route, 'path', UNMATCHED_ROUTE)
+            HTTP_REQUESTS.labels(method, route, status_code).inc()
+            HTTP_REQUEST_DURATION.labels(method, route).observe(elapsed)
+            HTTP_RESPONSE_SIZE.labels(method, route).observe(size)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import secrets
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.common.profiler import ProfileFormat, SamplingProfiler
+from backend.core.conf import settings
+
+
+class ProfilerMiddleware:
+    """
+    Profile requests carrying settings.PROFILER_TOKEN, the profile file name is returned in the X-Profile-File
+    response header
+
+    Only the task of the request is sampled, a request arriving while the worker is being profiled is not profiled
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        token: str = settings.PROFILER_TOKEN,
+        profile_format: ProfileFormat = settings.PROFILER_FORMAT,
+    ) -> None:
+        self.app = app
+        self.token = token.encode()
+        self.profile_format = profile_format
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        token = Headers(scope=scope).get(settings.PROFILER_TOKEN_HEADER)
+        if token is None or not secrets.compare_digest(token.encode(), self.token):
+            await self.app(scope, receive, send)
+            return
+        profiler = SamplingProfiler(name='request', task=asyncio.current_task())
+        if not profiler.start():
+            await self.app(scope, receive, send)
+            return
+
+        filename = profiler.filename(self.profile_format)
+
+        async def send_wrapper(message: Message) -> None:
+            if message['type'] == 'http.response.start':
+                MutableHeaders(scope=message).append('X-Profile-File', filename)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            await run_in_threadpool(profiler.write, filename)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import secrets
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.common.server_timing import reset_server_timing, start_server_timing
+from backend.core.conf import settings
+
+
+class ServerTimingMiddleware:
+    """
+    Per-request timing breakdown in the Server-Timing response header
+
+    The timing is stored in ``scope['server_timing']`` for the access log. Outside the dev environment, the header
+    is only sent to requests carrying settings.SERVER_TIMING_TOKEN, as it reveals backend internals
+    """
+
+    def __init__(self, app: ASGIApp, token: str | None = settings.SERVER_TIMING_TOKEN) -> None:
+        self.app = app
+        self.token = token
+        self.always = settings.ENVIRONMENT == 'dev'
+
+    def _expose(self, scope: Scope) -> bool:
+        if self.always:
+            return True
+        if not self.token:
+            return False
+        token = Headers(scope=scope).get(settings.SERVER_TIMING_TOKEN_HEADER)
+        return token is not None and secrets.compare_digest(token.encode(), self.token.encode())
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        timing, token = start_server_timing()
+        scope['server_timing'] = timing
+        expose = self._expose(scope)
+
+        async def send_wrapper(message: Message) -> None:
+            if expose and message['type'] == 'http.response.start':
+                headers = MutableHeaders(scope=message)
+                headers.append('Server-Timing', timing.header())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            reset_server_timing(token)
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+import statistics
+
+import pytest
+
+from backend.benchmarks.import_time import run_once
+
+# Wall clock time depends on the machine, the budget is only enforced where it is set, e.g. IMPORT_TIME_BUDGET_MS=2000
+_BUDGET_MS = os.getenv('IMPORT_TIME_BUDGET_MS')
+
+
+@pytest.mark.skipif(not _BUDGET_MS, reason='IMPORT_TIME_BUDGET_MS is not set')
+def test_import_time_budget() -> None:
+    budget_ms = float(_BUDGET_MS)
+    total_ms = statistics.median(run_once()[0] for _ in range(3))
+    assert total_ms <= budget_ms, f'Import time {total_ms:,.0f}ms exceeds the budget of {budget_ms:,.0f}ms'
+
+
+def test_deferred_modules_not_imported_at_startup() -> None:
+    _, _, _, deferred = run_once()
+    assert not deferred, f'Imported at startup, meant to be imported on first use: {", ".join(deferred)}'
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parity of MsgSpecJSONResponse with Starlette's JSONResponse, and of ``fast_success`` with FastAPI's
+``jsonable_encoder``. Floats in exponent notation are the known exception, msgspec writes ``1e16`` where
+``json.dumps`` writes ``1e+16``
+"""
+
+import asyncio
+
+from datetime import datetime, timedelta
+from datetime import timezone as datetime_timezone
+from decimal import Decimal
+from typing import Any
+from uuid import UUID
+
+import pytest
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from pydantic import HttpUrl
+
+from backend.app.admin.schema.token import GetLoginToken
+from backend.app.admin.schema.user import GetUserInfoDetail
+from backend.common.pagination import PageData
+from backend.common.response.response_schema import ResponseModel, ResponseSchemaModel, response_base
+from backend.core.conf import settings
+from backend.utils.serializers import MsgSpecJSONResponse
+from backend.utils.timezone import timezone
+
+
+def _user(i: int, **kwargs) -> dict[str, Any]:
+    now = datetime(2024, 2, 29, 23, 59, 59, 999999)
+    user = {
+        'username': f'用户{i}',
+        'email': f'user{i}@example.com',
+        'phone': None,
+        'id': i,
+        'uuid': str(UUID(int=i)),
+        'avatar': 'https://example.com/"avatar"\n.png',
+        'status': 1,
+        'is_superuser': i % 2 == 0,
+        'join_time': now,
+        'last_login_time': None,
+    }
+    return {**user, **kwargs}
+
+
+def _reference_datetime(dt: datetime) -> str:
+    return (
+        timezone.f_datetime(dt).strftime(settings.DATETIME_FORMAT)
+        if dt.tzinfo
+        else dt.strftime(settings.DATETIME_FORMAT)
+    )
+
+
+_AWARE = datetime(2024, 1, 1, 12, tzinfo=timezone.tz_info)
+
+_ROUTE_CASES = {
+    'user detail': (ResponseSchemaModel[GetUserInfoDetail], lambda: response_base.success(data=_user(1))),
+    'aware datetime': (
+        ResponseSchemaModel[GetUserInfoDetail],
+        lambda: response_base.success(data=_user(2, join_time=_AWARE, last_login_time=_AWARE)),
+    ),
+    'login token': (
+        ResponseSchemaModel[GetLoginToken],
+        lambda: response_base.success(
+            data={'access_token': 'token', 'access_token_type': 'Bearer', 'user': _user(3)},
+        ),
+    ),
+    'page': (
+        ResponseSchemaModel[PageData[GetUserInfoDetail]],
+        lambda: response_base.success(
+            data={
+                'items': [_user(i) for i in range(100)],
+                'total': 100,
+                'page': 1,
+                'size': 100,
+                'total_pages': 1,
+                'links': {'first': '/?page=1', 'last': '/?page=1', 'self': '/?page=1', 'next': None, 'prev': None},
+            }
+        ),
+    ),
+    'untyped data': (
+        ResponseModel,
+        lambda: response_base.success(
+            data={'float': 0.1, 'int': -(2**53), 'nested': [[], {}, [None, True]], 'str': ' '}
+        ),
+    ),
+}
+
+
+@pytest.mark.parametrize('type_, value', _ROUTE_CASES.values(), ids=_ROUTE_CASES.keys())
+def test_route_content_parity(type_: Any, value: Any) -> None:
+    field = create_response_field('parity', type_)
+    content = asyncio.run(serialize_response(field=field, response_content=value()))
+    assert MsgSpecJSONResponse(content).body == JSONResponse(content).body
+
+
+def test_fast_success_parity() -> None:
+    data = {
+        'naive': datetime(2024, 1, 1, 8, 30, 1, 123),
+        'aware': datetime(2024, 1, 1, 8, 30, 1, tzinfo=datetime_timezone(timedelta(hours=-5))),
+        'decimal': [Decimal('1.5'), Decimal('2'), Decimal('-0.125')],
+        'uuid': UUID(int=1),
+        'url': HttpUrl('https://example.com/a b'),
+        'model': GetUserInfoDetail(**_user(1)),
+        'tuple': (1, 'a', None),
+    }
+    expected = JSONResponse(
+        jsonable_encoder(
+            {'code': 200, 'msg': 'Request successful', 'data': data}, custom_encoder={datetime: _reference_datetime}
+        )
+    ).body
+    assert response_base.fast_success(data=data).body == expected
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Response cache tag versions against a redis sentinel and a redis cluster, skipped unless their nodes are given in
+TEST_REDIS_SENTINEL_NODES and TEST_REDIS_CLUSTER_NODES, e.g. from deploy/docker-compose/redis-topology.yml
+"""
+
+import asyncio
+import os
+
+import pytest
+
+from redis.crc import key_slot
+
+from backend.common.cache import ResponseCache
+from backend.core.conf import settings
+from backend.database.redis import close_redis, get_redis_binary_client, open_redis
+
+_PREFIX = 'fba:test:cache'
+
+_TOPOLOGIES = {
+    'sentinel': ('REDIS_SENTINEL_NODES', os.getenv('TEST_REDIS_SENTINEL_NODES')),
+    'cluster': ('REDIS_CLUSTER_NODES', os.getenv('TEST_REDIS_CLUSTER_NODES')),
+}
+
+
+@pytest.fixture(params=list(_TOPOLOGIES))
+def redis_mode(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> str:
+    setting, nodes = _TOPOLOGIES[request.param]
+    if not nodes:
+        pytest.skip(f'TEST_{setting} is not set')
+    monkeypatch.setattr(settings, 'REDIS_MODE', request.param)
+    monkeypatch.setattr(settings, setting, nodes.split(','))
+    monkeypatch.setattr(settings, 'REDIS_PASSWORD', None)
+    monkeypatch.setattr(settings, 'REDIS_DATABASE', 0)
+    monkeypatch.setattr(settings, 'REDIS_CLIENT_CACHE', False)
+    return request.param
+
+
+def test_tag_versions(redis_mode: str) -> None:
+    tags = [f'tag{i}' for i in range(20)]
+    keys = [f'{_PREFIX}:version:{tag}' for tag in tags]
+    # Versions of tags in different hash slots are read in one call
+    assert len({key_slot(key.encode()) for key in keys}) > 1
+
+    async def run() -> None:
+        await open_redis()
+        client = get_redis_binary_client()
+        try:
+            await client.unlink(*keys)
+            versions = await ResponseCache(_PREFIX, 100).tag_versions(tags)
+            assert versions is not None
+            # Another process reads the versions issued by the first one
+            assert await ResponseCache(_PREFIX, 100).tag_versions(tags) == versions
+            await client.incr(keys[0])
+            assert await ResponseCache(_PREFIX, 100).tag_versions(tags) == [versions[0] + 1, *versions[1:]]
+        finally:
+            await client.unlink(*keys)
+            await close_redis()
+
+    asyncio.run(run())
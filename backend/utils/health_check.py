@@ -23,6 +23,19 @@ def ensure_unique_route_names(app: FastAPI) -> None:
             temp_routes.add(route.name)
 
 
+async def http_limit_identifier(request: Request) -> str:
+    """
+    Request limiter identifier, the client ip is used as hash tag so that all limiter keys
+    of a client are stored in the same redis cluster slot
+
+    :param request:
+    :return:
+    """
+    forwarded = request.headers.get('X-Forwarded-For')
+    ip = forwarded.split(',')[0].strip() if forwarded else request.client.host
+    return f'{{{ip}}}:{request.scope["path"]}'
+
+
 async def http_limit_callback(request: Request, response: Response, expire: int):
     """
     Default callback function when request is limited
@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+from typing import Any
+
 from fastapi import FastAPI
 from fastapi.routing import APIRoute
+from msgspec.json import schema_components
+
+# JSON schema components of msgspec response types, merged into the app OpenAPI schema
+_struct_schema_components: dict[str, Any] = {}
 
 
 def simplify_operation_ids(app: FastAPI) -> None:
@@ -14,3 +20,40 @@ def simplify_operation_ids(app: FastAPI) -> None:
     for route in app.routes:
         if isinstance(route, APIRoute):
             route.operation_id = route.name
+
+
+def struct_response_schema(type_: Any, *, description: str = 'Successful Response') -> dict[str, Any]:
+    """
+    Route ``openapi_extra`` declaring a msgspec type as the success response schema, for routes that skip
+    response_model validation and return ``response_base.fast_success``
+
+    E.g. ::
+
+        @router.get('/test', openapi_extra=struct_response_schema(ResponseStructModel[GetApiStruct]))
+        async def test() -> Response: ...
+
+    :param type_: msgspec type, e.g. ``ResponseStructModel[GetApiStruct]``
+    :param description: Response description
+    :return:
+    """
+    (schema,), components = schema_components((type_,), ref_template='#/components/schemas/{name}')
+    _struct_schema_components.update(components)
+    return {'responses': {'200': {'description': description, 'content': {'application/json': {'schema': schema}}}}}
+
+
+def register_struct_schemas(app: FastAPI) -> None:
+    """
+    Add the schema components of msgspec response types to the generated OpenAPI schema
+
+    :param app:
+    :return:
+    """
+    openapi = app.openapi
+
+    def openapi_with_structs() -> dict[str, Any]:
+        if app.openapi_schema is None:
+            schema = openapi()
+            schema.setdefault('components', {}).setdefault('schemas', {}).update(_struct_schema_components)
+        return app.openapi_schema
+
+    app.openapi = openapi_with_structs
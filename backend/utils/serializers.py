@@ -1,18 +1,111 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+from datetime import datetime, tzinfo
 from decimal import Decimal
-from typing import Any, Sequence, TypeVar
+from operator import attrgetter, itemgetter
+from typing import Any, Callable, Generic, Sequence, TypeVar
 
-from fastapi.encoders import decimal_encoder
-from msgspec import json
-from sqlalchemy import Row, RowMapping
+from fastapi.encoders import decimal_encoder, jsonable_encoder
+from msgspec import json, msgpack
+from pydantic import BaseModel
+from sqlalchemy import Column, Row, RowMapping
 from sqlalchemy.orm import ColumnProperty, SynonymProperty, class_mapper
 from starlette.responses import JSONResponse
 
+from backend.common.server_timing import timing_span
+from backend.core.conf import settings
+from backend.utils.timezone import timezone
+
 RowData = Row | RowMapping | Any
 
 R = TypeVar('R', bound=RowData)
 
+T = TypeVar('T')
+
+# Compiled column serializers and property keys, per mapped class
+_model_serializers: dict[type, Callable[[Any], dict[str, Any]]] = {}
+_model_property_keys: dict[type, tuple[tuple[str, ...], Callable[[Any], tuple]]] = {}
+
+
+def _tuple_getter(*keys: str) -> Callable[[Any], tuple]:
+    """
+    Compile a getter of the attribute values of a mapped instance
+
+    Loaded values are read from the instance ``__dict__`` directly, instrumented attributes are only used when
+    a value is expired or deferred
+
+    :param keys: Attribute keys
+    :return:
+    """
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda obj: (getattr(obj, key),)
+    loaded_getter = itemgetter(*keys)
+    attr_getter = attrgetter(*keys)
+
+    def getter(obj: Any) -> tuple:
+        try:
+            return loaded_getter(obj.__dict__)
+        except KeyError:
+            return attr_getter(obj)
+
+    return getter
+
+
+def _convert_decimal(value: Decimal | None) -> int | float | None:
+    return None if value is None else decimal_encoder(value)
+
+
+def _column_converter(column: Column) -> Callable[[Any], Any] | None:
+    """
+    Value converter of a column, chosen once from the column type
+
+    :param column:
+    :return:
+    """
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return None
+    if issubclass(python_type, Decimal):
+        return _convert_decimal
+    return None
+
+
+def get_model_serializer(model: type) -> Callable[[Any], dict[str, Any]]:
+    """
+    Get the column serializer of a mapped class, compiled on first use into one attribute getter over all table
+    columns plus converters for the columns that need one
+
+    :param model: SQLAlchemy mapped class
+    :return:
+    """
+    serializer = _model_serializers.get(model)
+    if serializer is None:
+        columns = model.__table__.columns
+        keys = tuple(columns.keys())
+        getter = _tuple_getter(*keys)
+        converters = tuple(
+            (index, converter)
+            for index, column in enumerate(columns)
+            if (converter := _column_converter(column)) is not None
+        )
+        if converters:
+
+            def serializer(row: Any) -> dict[str, Any]:
+                values = list(getter(row))
+                for index, convert in converters:
+                    values[index] = convert(values[index])
+                return dict(zip(keys, values))
+
+        else:
+
+            def serializer(row: Any) -> dict[str, Any]:
+                return dict(zip(keys, getter(row)))
+
+        _model_serializers[model] = serializer
+    return serializer
+
 
 def select_columns_serialize(row: R) -> dict[str, Any]:
     """
@@ -21,13 +114,7 @@ def select_columns_serialize(row: R) -> dict[str, Any]:
     :param row: SQLAlchemy query result row
     :return:
     """
-    result = {}
-    for column in row.__table__.columns.keys():
-        value = getattr(row, column)
-        if isinstance(value, Decimal):
-            value = decimal_encoder(value)
-        result[column] = value
-    return result
+    return get_model_serializer(type(row))(row)
 
 
 def select_list_serialize(row: Sequence[R]) -> list[dict[str, Any]]:
@@ -37,7 +124,21 @@ def select_list_serialize(row: Sequence[R]) -> list[dict[str, Any]]:
     :param row: List of SQLAlchemy query result rows
     :return:
     """
-    return [select_columns_serialize(item) for item in row]
+    return [get_model_serializer(type(item))(item) for item in row]
+
+
+def select_rows_mapping(rows: Sequence[Row]) -> list[dict[str, Any]]:
+    """
+    Convert column projection rows to dictionaries by the keys of ``Row._mapping``, without ORM instance state.
+    Rows of one result share their keys, so they are read once
+
+    :param rows: List of SQLAlchemy column query result rows
+    :return:
+    """
+    if not rows:
+        return []
+    keys = tuple(rows[0]._mapping.keys())
+    return [dict(zip(keys, row)) for row in rows]
 
 
 def select_as_dict(row: R, use_alias: bool = False) -> dict[str, Any]:
@@ -49,24 +150,126 @@ def select_as_dict(row: R, use_alias: bool = False) -> dict[str, Any]:
     :return:
     """
     if not use_alias:
-        result = row.__dict__
-        if '_sa_instance_state' in result:
-            del result['_sa_instance_state']
-    else:
-        result = {}
+        # Copy, the instance __dict__ holds the ORM instance state and must not be modified
+        return {key: value for key, value in row.__dict__.items() if key != '_sa_instance_state'}
+
+    property_keys = _model_property_keys.get(row.__class__)
+    if property_keys is None:
         mapper = class_mapper(row.__class__)  # type: ignore
-        for prop in mapper.iterate_properties:
-            if isinstance(prop, (ColumnProperty, SynonymProperty)):
-                key = prop.key
-                result[key] = getattr(row, key)
+        keys = tuple(
+            prop.key for prop in mapper.iterate_properties if isinstance(prop, (ColumnProperty, SynonymProperty))
+        )
+        property_keys = _model_property_keys[row.__class__] = (keys, _tuple_getter(*keys))
+    keys, getter = property_keys
+    return dict(zip(keys, getter(row)))
+
+
+# Formats equivalent to ``datetime.isoformat(sep, timespec)`` of a naive datetime, which runs in C
+_ISO_DATETIME_FORMATS = {
+    '%Y-%m-%d %H:%M:%S': (' ', 'seconds'),
+    '%Y-%m-%dT%H:%M:%S': ('T', 'seconds'),
+    '%Y-%m-%d %H:%M:%S.%f': (' ', 'microseconds'),
+    '%Y-%m-%dT%H:%M:%S.%f': ('T', 'microseconds'),
+}
+
+
+def compile_datetime_formatter(format_str: str, tz: tzinfo) -> Callable[[datetime], str]:
+    """
+    Compile a datetime formatter once, aware datetimes are converted to the timezone first
+
+    :param format_str: The time format string
+    :param tz: Timezone of aware datetimes
+    :return:
+    """
+    if format_str in _ISO_DATETIME_FORMATS:
+        sep, timespec = _ISO_DATETIME_FORMATS[format_str]
+
+        def formatter(dt: datetime) -> str:
+            if dt.tzinfo is not None:
+                dt = dt.astimezone(tz).replace(tzinfo=None)
+            return dt.isoformat(sep, timespec)
+
+    else:
+
+        def formatter(dt: datetime) -> str:
+            if dt.tzinfo is not None:
+                dt = dt.astimezone(tz)
+            return dt.strftime(format_str)
+
+    return formatter
+
+
+# Datetime formatter of settings.DATETIME_FORMAT and settings.DATETIME_TIMEZONE
+format_datetime = compile_datetime_formatter(settings.DATETIME_FORMAT, timezone.tz_info)
+
+
+def format_json_values(obj: Any) -> Any:
+    """
+    Format datetimes with settings.DATETIME_FORMAT and decimals as numbers, nested in dicts and lists, for data
+    encoded by msgspec without a schema, Structs are kept as they are
+
+    :param obj:
+    :return:
+    """
+    obj_type = type(obj)
+    if obj_type is dict:
+        return {key: format_json_values(value) for key, value in obj.items()}
+    if obj_type is list or obj_type is tuple:
+        return [format_json_values(value) for value in obj]
+    if obj_type is datetime:
+        return format_datetime(obj)
+    if obj_type is Decimal:
+        return decimal_encoder(obj)
+    return obj
+
 
-    return result
+def _json_enc_hook(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode='json')
+    # HttpUrl, Path, bytes and other types FastAPI can encode
+    return jsonable_encoder(obj)
 
 
 class MsgSpecJSONResponse(JSONResponse):
     """
     A response class that uses the high-performance msgspec library to serialize data as JSON.
+
+    Output of pydantic serialized content is byte identical to ``JSONResponse``, other types unknown to
+    msgspec fall back to ``jsonable_encoder``
     """
 
+    encoder = json.Encoder(enc_hook=_json_enc_hook, decimal_format='number')
+
     def render(self, content: Any) -> bytes:
-        return json.encode(content)
+        with timing_span('encode'):
+            return self.encoder.encode(content)
+
+
+def _msgpack_enc_hook(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, Decimal):
+        return decimal_encoder(obj)
+    raise NotImplementedError(f'Objects of type {type(obj)} are not supported')
+
+
+class MsgpackCodec(Generic[T]):
+    """
+    Typed msgpack codec, decoding straight into the given type (e.g. ``msgspec.Struct``) without intermediate dicts
+
+    E.g. ::
+
+        codec = MsgpackCodec(GetUserInfoSnapshot)
+        data = codec.encode(snapshot)
+        snapshot = codec.decode(data)
+    """
+
+    def __init__(self, type_: type[T] = Any):
+        self.encoder = msgpack.Encoder(enc_hook=_msgpack_enc_hook)
+        self.decoder = msgpack.Decoder(type_)
+
+    def encode(self, obj: T) -> bytes:
+        return self.encoder.encode(obj)
+
+    def decode(self, data: bytes) -> T:
+        return self.decoder.decode(data)
@@ -1,4 +1,10 @@
 # fmt: off
+import gc
+import multiprocessing
+import os
+
+from dotenv import dotenv_values
+
 # Listen on internal network port
 bind = '0.0.0.0:8001'
 
@@ -6,7 +12,16 @@ bind = '0.0.0.0:8001'
 chdir = '/fsm/backend/'
 
 # Number of parallel worker processes
-workers = 1
+workers = multiprocessing.cpu_count()
+
+# With several workers one process writes the log files, unless LOG_WRITER is set in the environment or in .env.
+# Set before the app is loaded, which reads it from the environment
+if workers > 1 and 'LOG_WRITER' not in os.environ and 'LOG_WRITER' not in dotenv_values(os.path.join(chdir, '.env')):
+    os.environ['LOG_WRITER'] = 'true'
+
+# Load the app once in the master and fork the workers from it, so the imported code is shared copy-on-write.
+# The database engine and the redis clients are created by each worker in the lifespan, after the fork
+preload_app = True
 
 # Listen queue size
 backlog = 512
@@ -42,4 +57,37 @@ loglevel = 'debug'
 # Python program path
 pythonpath = '/usr/local/lib/python3.10/site-packages'
 
+
+# Metrics value files of a previous run are removed before the workers start
+# With settings.LOG_WRITER, the log writer process starts before the workers and stops after them
+def on_starting(server):
+    from backend.common.log_writer import start_writer
+    from backend.common.metrics import clear_metrics_dir
+    from backend.core.conf import settings
+
+    clear_metrics_dir()
+    if settings.LOG_WRITER:
+        server.log_writer = start_writer()
+
+
+# Objects of the preloaded app are moved out of the garbage collector's reach, so collections in the workers do not
+# write to, and copy, the pages shared with the master
+def when_ready(server):
+    gc.freeze()
+
+
+def on_exit(server):
+    from backend.common.log_writer import stop_writer
+
+    if getattr(server, 'log_writer', None) is not None:
+        stop_writer(server.log_writer)
+
+
+# Gauges of an exited worker no longer apply, its counters and histograms are kept
+def child_exit(server, worker):
+    from backend.common.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
+
+
 # Start gunicorn with: gunicorn -c gunicorn.conf.py main:app